@@ -0,0 +1,99 @@
+#Loader for the adjusted actuarial table (adj_act_data_2014.txt)
+#The table is written by get_actdata_2014.py with one row per year and the columns
+#  year, M_dp, M_le, M_notdead, M_alive_prob, F_dp, F_le, F_notdead, F_alive_prob
+#It is parsed once per process into a float array shared by name_age.py,
+#demographics.py and the other programs. Slicing by year range returns a view
+#(no copy), and the years column is checked instead of assuming the first row is 1880.
+#The probabilities to be alive are for the last year of the table (2017); for a
+#later reference year everybody is older, so the table is shifted (see alive_prob).
+
+import os
+import hashlib
+import numpy as np
+
+
+ACTUARIAL_FILE = "adj_act_data_2014.txt"  #file generated using get_actdata_2014.py
+
+COLUMNS = ("year", "M_dp", "M_le", "M_notdead", "M_alive_prob",
+           "F_dp", "F_le", "F_notdead", "F_alive_prob")
+
+_tables = {}  #(filename, modification time) -> parsed table
+
+
+def load_actuarial_table(filename=ACTUARIAL_FILE):
+    """Returns the actuarial table as a read only (years x 9) float array.
+    The file is only parsed the first time (and again if it changes on disk).
+    Raises ValueError if the years in the first column are not consecutive.
+    """
+    key = (filename, os.path.getmtime(filename))
+    if key in _tables:
+        return _tables[key]
+
+    table = np.loadtxt(filename, delimiter=",", ndmin=2)
+    if table.shape[1] != len(COLUMNS):
+        raise ValueError("%s has %d columns, expected %d" % (filename, table.shape[1], len(COLUMNS)))
+    if np.any(np.diff(table[:, 0]) != 1):
+        raise ValueError("the years in %s are not consecutive" % filename)
+
+    table.flags.writeable = False  #shared by every caller
+    for old_key in [k for k in _tables if k[0] == filename]:
+        del _tables[old_key]
+    _tables[key] = table
+
+    return table
+
+
+def table_version(filename=ACTUARIAL_FILE):
+    """Returns a hash of the contents of the actuarial file, saved with
+    results computed from it (see stats_table.py) to tell if they are out of date
+    """
+    with open(filename, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def year_rows(table, years):
+    """Given the table and a list of consecutive years,
+    returns the slice of table rows for those years
+    """
+    first_year = int(table[0, 0])
+    last_year = int(table[-1, 0])
+    if min(years) < first_year or max(years) > last_year:
+        raise ValueError("years %d-%d are not in the actuarial table (%d-%d)"
+                         % (min(years), max(years), first_year, last_year))
+    if len(years) != max(years) - min(years) + 1:
+        raise ValueError("years must be consecutive to line up with the actuarial table")
+
+    return slice(min(years) - first_year, max(years) - first_year + 1)
+
+
+def get_column(column, years, filename=ACTUARIAL_FILE):
+    """Returns the named column (see COLUMNS) for years, as a read only view"""
+    table = load_actuarial_table(filename)
+    return table[year_rows(table, years), COLUMNS.index(column)]
+
+
+def alive_prob(sex, years, filename=ACTUARIAL_FILE, reference_year=None):
+    """Returns the probability of being alive for sex ("M" or "F") and each of the years.
+    By default that is the probability to be alive in the last year of the table (2017),
+    returned as a read only view of the table.
+    With a different reference_year (e.g. 2018 after adding yob2018.txt) the ages are
+    shifted: someone born in year y is reference_year - y years old, so gets the value
+    of the table row with that age. Years with no such row get 0 (too old, or not born yet).
+    """
+    if sex not in ("M", "F"):
+        raise ValueError("sex must be M or F, not %r" % (sex,))
+
+    table = load_actuarial_table(filename)
+    last_year = int(table[-1, 0])
+    if reference_year is None or reference_year == last_year:
+        return get_column(sex + "_alive_prob", years, filename)
+
+    column = table[:, COLUMNS.index(sex + "_alive_prob")]
+    table_years = np.asarray(years) - (reference_year - last_year)
+    rows = table_years - int(table[0, 0])
+    inside = (rows >= 0) & (rows < len(column))
+
+    shifted = np.zeros(len(years))
+    shifted[inside] = column[rows[inside]]
+
+    return shifted
@@ -0,0 +1,234 @@
+#The original (June 2018) implementations of the pipeline stages
+#Kept unchanged so benchmark.py has something real to compare the current code
+#against; demographics.py, name_age.py and get_actdata_2014.py have since been
+#rewritten (bulk parser, sparse counts, weighted statistics, cumulative product).
+#  get_allnames_year / build_allyears_dict - one regex per line of every year file
+#  extract_allnames / patch_years_dict     - every name, then a zero for every missing year
+#  quick_sum / extract_name_numbers        - one dict lookup per name and year
+#  open_actuarial_data                     - the csv file parsed again on every call
+#  get_stats                               - expands number_alive into one entry per person
+#  get_singlename_year / calc_number_alive - a regex over a whole year file per name and year
+#  fixed_actuarial_data                    - the nested survival loop, O(ages^2)
+#Nothing else should import this module.
+
+import re
+import csv
+import numpy as np
+import scipy.stats as st
+import get_actdata_2014
+
+
+def get_allnames_year(year):
+    """Given an integer year, reads names/yobYYYY.txt with a regex per line.
+    Returns a dict tuple (Male, Female) of name: number for that year
+    """
+    singleyear_F_dict = {}
+    singleyear_M_dict = {}
+
+    filename = "names/yob" + str(year) + ".txt"
+
+    with open(filename) as f:
+        for i, line in enumerate(f):
+            n_tuple = re.findall(r'(\w+),(\w),(\d+)', line)
+
+            name = n_tuple[0][0]
+            sex = n_tuple[0][1]
+            number = int(n_tuple[0][2])
+
+            if sex == "F":
+                singleyear_F_dict[name] = number
+            else:
+                singleyear_M_dict[name] = number
+
+    return (singleyear_M_dict, singleyear_F_dict)
+
+
+def build_allyears_dict(years):
+    """Calls get_allnames_year(year) for every year, one after another"""
+    years_F_dict = {}
+    years_M_dict = {}
+    for year in years:
+        singleyear_M_dict, singleyear_F_dict = get_allnames_year(year)
+        years_M_dict[year] = singleyear_M_dict
+        years_F_dict[year] = singleyear_F_dict
+
+    return (years_M_dict, years_F_dict)
+
+
+def extract_allnames(years, years_dict):
+    """Returns a dict of every name in the years dictionary"""
+    names = {}
+    for year in years:
+        for name in years_dict[year].keys():
+            names[name] = name
+
+    return names
+
+
+def patch_years_dict(years_dict, names_dict, years):
+    """Fills in a zero for every (year, name) pair missing from the years dictionary"""
+    for name in names_dict:
+        for year in years_dict:
+            if name not in years_dict[year]:
+                years_dict[year][name] = 0
+
+    return years_dict
+
+
+def extract_name_numbers(name, years, patched_dict):
+    numbers = []
+    for year in years:
+        numbers.append(patched_dict[year][name])
+
+    return numbers
+
+
+def quick_sum(name, years, patched_dict):
+
+    total = 0
+    for year in years:
+        total += patched_dict[year][name]
+
+    return total
+
+
+def open_actuarial_data(sex, years):
+    """Reads adj_act_data_2014.txt with the csv module and returns
+    the probability to be alive in 2017 for sex ("M" or "F") and years
+    """
+    filename = "adj_act_data_2014.txt"
+
+    all_data = []
+    with open(filename) as f:
+        text = csv.reader(f)
+        for line in text:
+            all_data.append(line)
+
+    alive_prob = []
+    shift = min(years) - 1880
+    for index, item in enumerate(years):
+        index += shift
+        if sex == "M":
+            alive_prob.append(float(all_data[index][4]))
+        elif sex == "F":
+            alive_prob.append(float(all_data[index][8]))
+        else:
+            return False
+
+    return alive_prob
+
+
+def get_stats(number_alive, years):
+    """(mean, median, stddev, skewness, kurtosis) of the histogram with
+    one entry per person (a fractional weight counts as the next integer)
+    """
+    data = []
+    for index, value in enumerate(number_alive):
+        i = 0
+        while i < value:
+            data.append(years[index])
+            i += 1
+
+    mean = np.mean(data)
+    median = np.median(data)
+    stddev = np.std(data)
+    sk = st.skew(data)
+    kurt = st.kurtosis(data)
+
+    return (mean, median, stddev, sk, kurt)
+
+
+def get_singlename_year(name, sex, year):
+    """Number of babies named name of sex in year, found with a regex over the year file"""
+    filename = "names/yob" + str(year) + ".txt"
+
+    with open(filename) as f:
+        text = f.read()
+        pat = name + "," + sex + ",(\d+)"
+        result = re.findall(pat, text)
+
+    if result == []:
+        number = 0
+    else:
+        number = int(result[0])
+    return number
+
+
+def get_name_numbers(name, sex, years):
+    data = []
+    for year in years:
+        number = get_singlename_year(name, sex, year)
+        data.append(number)
+
+    return data
+
+
+def calc_number_alive(name, sex, years):
+    """Number of babies named name expected to be alive in 2017, for each of the years"""
+    alive_prob = open_actuarial_data(sex, years)
+    names_data = get_name_numbers(name, sex, years)
+
+    number_alive = names_data[:]
+    for index, num in enumerate(names_data):
+        number_alive[index] = names_data[index] * alive_prob[index]
+
+    return number_alive
+
+
+def fixed_actuarial_data(act_table_dict, years):
+    """The adjusted actuarial table (see get_actdata_2014.fixed_actuarial_data),
+    with the probability to be alive multiplied out age by age for every age
+    """
+    data = get_actdata_2014.dict_to_arrays(act_table_dict)
+    ages = data[0]
+    M_dp = data[1]
+    M_le = data[2]
+    F_dp = data[3]
+    F_le = data[4]
+
+    M_notdead = M_dp[:]
+    for index, mdp in enumerate(M_dp):
+        M_notdead[index] = 1 - mdp
+
+    M_alive_prob = M_notdead[:]
+    for index, mnd in enumerate(M_notdead):
+        count = index - 1
+        M_alive_prob[index] = mnd
+        while count > 0:
+            M_alive_prob[index] *= M_notdead[count]
+            count -= 1
+
+    F_notdead = F_dp[:]
+    for index, fdp in enumerate(F_dp):
+        F_notdead[index] = 1 - fdp
+
+    F_alive_prob = F_notdead[:]
+    for index, mnd in enumerate(F_notdead):
+        count = index - 1
+        F_alive_prob[index] = mnd
+        while count > 0:
+            F_alive_prob[index] *= F_notdead[count]
+            count -= 1
+
+    for index, age in enumerate(ages):
+        ages[index] = max(years) - age
+
+    i = min(ages) - 1
+    while len(ages) < len(years):
+        ages.append(i)
+        M_alive_prob.append(0)
+        M_notdead.append(0)
+        M_le.append(0)
+        M_dp.append(1)
+        F_alive_prob.append(0)
+        F_notdead.append(0)
+        F_le.append(0)
+        F_dp.append(1)
+        i -= 1
+
+    adj_data = []
+    for column in (ages, M_dp, M_le, M_notdead, M_alive_prob, F_dp, F_le, F_notdead, F_alive_prob):
+        column.reverse()
+        adj_data.append(column)
+
+    return adj_data
@@ -0,0 +1,339 @@
+#Benchmarks for the stages of the names pipeline
+#Times every stage of demographics.py and name_age.py with the original
+#("baseline") engine, kept in baseline.py, and with the current ("new") engine:
+#  build_allyears_dict  - read the SSA text files  (baseline: a regex per line,
+#                                                    new: compile the binary store)
+#  extract_allnames     - all unique names          (new: load the store name table)
+#  patch_years_dict     - fill in the zeros         (new: read_sparse_counts, the files read
+#                                                    straight into sparse arrays, no zeros)
+#  stats_loop           - statistics of every name above the threshold, both sexes
+#                         (baseline: one name at a time, expanding the histogram,
+#                          new: get_stats_all_names on the store)
+#  single_name          - number alive + statistics for a few names
+#                         (baseline: a regex over every year file, new: the store)
+#  fixed_actuarial_data - get_actdata_2014.py on a table rebuilt from adj_act_data_2014.txt
+#                         (baseline: the nested survival loop, new: cumulative product)
+#Each stage runs in its own process, so the peak memory (max RSS) is the stage's own.
+#The timings are repeated (the best is the most repeatable number) and written
+#as JSON with the git commit, so runs on different commits can be compared:
+#  python benchmark.py [repeat] [out.json]
+#  python benchmark.py compare old.json new.json
+
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+import names_store
+import actuarial
+import demographics
+import name_age
+import get_actdata_2014
+import stage_timer
+import baseline
+
+
+THRESHOLD = 400000  #the demographics.py example threshold
+QUERY_NAMES = [("Brittany", "F"), ("Barbara", "F"), ("Jennifer", "F"),
+               ("Mark", "M"), ("Jason", "M"), ("John", "M")]
+
+
+#Stage setup, run once per stage (not timed)
+
+def setup_baseline_dicts(years):
+    years_M_dict, years_F_dict = baseline.build_allyears_dict(years)
+    return {"F": years_F_dict, "M": years_M_dict}
+
+
+def setup_baseline_names(years):
+    years_dicts = setup_baseline_dicts(years)
+    names = dict((sex, baseline.extract_allnames(years, years_dicts[sex])) for sex in ("F", "M"))
+    return {"years_dicts": years_dicts, "names": names}
+
+
+def setup_baseline_patched(years):
+    data = setup_baseline_names(years)
+    for sex in ("F", "M"):
+        baseline.patch_years_dict(data["years_dicts"][sex], data["names"][sex], years)
+    return data
+
+
+def setup_store(years):
+    """Compiles a store in a temporary directory, removed at the end of the stage"""
+    store_dir = tempfile.mkdtemp(prefix="names_store_bench")
+    names_store.compile_names_store(years, store_dir=store_dir)
+    return {"store_dir": store_dir, "store": names_store.load_names_store(store_dir)}
+
+
+def setup_actuarial_dict(years):
+    """The 0-119 age table as returned by get_actuarial_website_data(),
+    rebuilt from the adjusted file so the benchmark needs no network
+    """
+    table = actuarial.load_actuarial_table()
+    columns = [actuarial.COLUMNS.index(column) for column in ("M_dp", "M_le", "F_dp", "F_le")]
+    rows = table[::-1][:120]  #last year = age 0
+    return dict((age, tuple(rows[age, columns])) for age in range(len(rows)))
+
+
+def copy_years_dicts(data):
+    """patch_years_dict changes its input, so every repeat gets a fresh copy"""
+    years_dicts = dict((sex, dict((year, dict(counts)) for year, counts in data["years_dicts"][sex].iteritems()))
+                       for sex in ("F", "M"))
+    return dict(data, years_dicts=years_dicts)
+
+
+#Baseline engine (the original code, see baseline.py)
+
+def baseline_ingest(years, data):
+    return baseline.build_allyears_dict(years)
+
+
+def baseline_extract(years, data):
+    return [baseline.extract_allnames(years, data[sex]) for sex in ("F", "M")]
+
+
+def baseline_patch(years, data):
+    return [baseline.patch_years_dict(data["years_dicts"][sex], data["names"][sex], years)
+            for sex in ("F", "M")]
+
+
+def baseline_stats_loop(years, data):
+    """The original demographics.py loop: one name at a time through the patched dicts"""
+    results = {}
+    for sex in ("F", "M"):
+        alive_prob = baseline.open_actuarial_data(sex, years)
+        patched_dict = data["years_dicts"][sex]
+        results[sex] = {}
+        for name in data["names"][sex]:
+            total = baseline.quick_sum(name, years, patched_dict)
+            if total > THRESHOLD:
+                numbers = baseline.extract_name_numbers(name, years, patched_dict)
+                number_alive = [number * prob for number, prob in zip(numbers, alive_prob)]
+                results[sex][name] = baseline.get_stats(number_alive, years) + (total,)
+    return results
+
+
+def baseline_single_name(years, data):
+    results = []
+    for name, sex in QUERY_NAMES:
+        number_alive = baseline.calc_number_alive(name, sex, years)
+        results.append(baseline.get_stats(number_alive, years))
+    return results
+
+
+def baseline_fixed_actuarial_data(years, data):
+    return baseline.fixed_actuarial_data(data, years)
+
+
+#New engine
+
+def new_ingest(years, data):
+    store_dir = tempfile.mkdtemp(prefix="names_store_bench")
+    try:
+        return names_store.compile_names_store(years, store_dir=store_dir)
+    finally:
+        shutil.rmtree(store_dir)
+
+
+def new_extract(years, data):
+    names_store._loaded_stores.pop(data["store_dir"], None)  #read the files, not the cached copy
+    return [names_store.load_names_store(data["store_dir"])[sex]["names"] for sex in ("F", "M")]
+
+
+def new_patch(years, data):
+    """The whole no-store path: there are no year dictionaries left to patch"""
+    return demographics.read_sparse_counts(years)
+
+
+def new_stats_loop(years, data):
+    results = {}
+    store = data["store"]
+    for sex in ("F", "M"):
+        alive_prob = demographics.open_actuarial_data(sex, years)
+        rows = np.nonzero(store[sex]["totals"] > THRESHOLD)[0]
+        stats = demographics.get_stats_all_names(store[sex]["counts"], alive_prob, years, rows)
+        results[sex] = demographics.make_results_dict(store[sex]["names"], rows, store[sex]["totals"], stats)
+    return results
+
+
+def new_single_name(years, data):
+    results = []
+    for name, sex in QUERY_NAMES:
+        names_data = names_store.get_name_counts(data["store"], name, sex, years)
+        number_alive = name_age.calc_number_alive(name, sex, years, names_data)
+        results.append(name_age.analysis(number_alive, years))
+    return results
+
+
+def new_fixed_actuarial_data(years, data):
+    return get_actdata_2014.fixed_actuarial_data(data, years)
+
+
+#stage: engine: (setup, fresh copy per repeat or None, function to time)
+STAGES = [("build_allyears_dict", {"baseline": (None, None, baseline_ingest),
+                                   "new": (None, None, new_ingest)}),
+          ("extract_allnames", {"baseline": (setup_baseline_dicts, None, baseline_extract),
+                                "new": (setup_store, None, new_extract)}),
+          ("patch_years_dict", {"baseline": (setup_baseline_names, copy_years_dicts, baseline_patch),
+                                "new": (None, None, new_patch)}),
+          ("stats_loop", {"baseline": (setup_baseline_patched, None, baseline_stats_loop),
+                          "new": (setup_store, None, new_stats_loop)}),
+          ("single_name", {"baseline": (None, None, baseline_single_name),
+                           "new": (setup_store, None, new_single_name)}),
+          ("fixed_actuarial_data", {"baseline": (setup_actuarial_dict, None, baseline_fixed_actuarial_data),
+                                    "new": (setup_actuarial_dict, None, new_fixed_actuarial_data)})]
+ENGINES = ("baseline", "new")
+
+
+def time_stage(stage, engine, years, repeat, queue):
+    """Runs in a child process: times repeat runs of one engine of a stage
+    and puts the result dict on the queue
+    """
+    setup, fresh, function = stage[1][engine]
+
+    data = None
+    try:
+        data = setup(years) if setup is not None else None
+        start_rss = stage_timer.peak_rss_mb()
+        wall_times = []
+        cpu_times = []
+        for i in range(repeat):
+            args = fresh(data) if fresh is not None else data
+            start_wall = time.time()
+            start_cpu = stage_timer.cpu_time()
+            function(years, args)
+            wall_times.append(time.time() - start_wall)
+            cpu_times.append(stage_timer.cpu_time() - start_cpu)
+            del args
+        result = {"wall_s": summarize(wall_times), "cpu_s": summarize(cpu_times),
+                  "setup_peak_rss_mb": start_rss, "peak_rss_mb": stage_timer.peak_rss_mb()}
+    except Exception as error:
+        result = {"error": "%s: %s" % (type(error).__name__, error)}
+    finally:
+        if isinstance(data, dict) and "store_dir" in data:
+            shutil.rmtree(data["store_dir"])
+
+    queue.put(result)
+
+
+def summarize(times):
+    return {"best": min(times), "median": float(np.median(times)),
+            "mean": float(np.mean(times)), "runs": len(times)}
+
+
+def run_stage(stage, engine, years, repeat):
+    """Times one engine of a stage in a fresh process"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=time_stage, args=(stage, engine, years, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=open(os.devnull, "w"),
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(years, repeat=3, stages=None):
+    """Runs every stage (or the named stages) with both engines.
+    Returns the results dict: the environment and, under "stages",
+    stage: {"baseline": timings, "new": timings}
+    """
+    results = {"commit": git_commit(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "python": platform.python_version(), "numpy": np.__version__,
+               "machine": platform.machine(), "cpus": multiprocessing.cpu_count(),
+               "years": [min(years), max(years)], "repeat": repeat, "stages": {}}
+
+    for stage in STAGES:
+        if stages is not None and stage[0] not in stages:
+            continue
+        results["stages"][stage[0]] = {}
+        for engine in ENGINES:
+            if engine in stage[1]:
+                results["stages"][stage[0]][engine] = run_stage(stage, engine, years, repeat)
+
+    return results
+
+
+def compare_results(old, new):
+    """Returns a list of (stage, engine, old best, new best, speedup) for the timings
+    in both results dicts (e.g. two commits)
+    """
+    rows = []
+    for stage in sorted(set(old["stages"]) & set(new["stages"])):
+        for engine in ENGINES:
+            old_timing = old["stages"][stage].get(engine, {})
+            new_timing = new["stages"][stage].get(engine, {})
+            if "wall_s" in old_timing and "wall_s" in new_timing:
+                old_best = old_timing["wall_s"]["best"]
+                new_best = new_timing["wall_s"]["best"]
+                rows.append((stage, engine, old_best, new_best, old_best / max(new_best, 1e-9)))
+
+    return rows
+
+
+def print_results(results):
+    print "%-24s %-9s %10s %10s %12s" % ("stage", "engine", "best (s)", "cpu (s)", "peak (MB)")
+    for stage in STAGES:
+        for engine in ENGINES:
+            timing = results["stages"].get(stage[0], {}).get(engine)
+            if timing is None:
+                continue
+            if "error" in timing:
+                print "%-24s %-9s %s" % (stage[0], engine, timing["error"])
+            else:
+                print "%-24s %-9s %10.3f %10.3f %12.1f" % (stage[0], engine, timing["wall_s"]["best"],
+                                                          timing["cpu_s"]["best"], timing["peak_rss_mb"])
+
+
+def main():
+
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        with open(sys.argv[2]) as f:
+            old = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        print
+        print "Comparing %s (%s) with %s (%s)" % (sys.argv[2], old["commit"], sys.argv[3], new["commit"])
+        print "%-24s %-9s %10s %10s %8s" % ("stage", "engine", "old (s)", "new (s)", "speedup")
+        for row in compare_results(old, new):
+            print "%-24s %-9s %10.3f %10.3f %7.2fx" % row
+        print
+        return
+
+    years = range(1880, 2018)
+    repeat = 3
+    out = "benchmark.json"
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        out = sys.argv[2]
+
+    print
+    print "Benchmarking every stage %d times (takes a few minutes) ..." % repeat
+    print
+
+    results = run_benchmarks(years, repeat)
+    print_results(results)
+
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    print
+    print "... results written to %s" % out
+    print
+
+
+if __name__ == '__main__':
+  main()
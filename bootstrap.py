@@ -0,0 +1,161 @@
+#Bootstrap confidence bands for the statistics of every name
+#demographics_filter keeps names with stddev < 15 and kurtosis > 0, but those are
+#point estimates, and for rarer names the kurtosis is very noisy. Here the births of
+#each name are resampled: every replicate draws the same number of babies over the
+#years (multinomial, with the observed shares of each year), the number alive is
+#recomputed with the actuarial table and the statistics with weighted_stats_matrix.
+#The spread of the replicates gives a confidence band for each statistic, and the
+#share of the replicates passing the filter tells how robust a characteristic name is.
+#The draws are vectorized over names and replicates (one binomial draw per year for
+#all of them: a multinomial is a chain of binomials) and blocks of names are spread
+#over a process pool. Each block has its own fixed seed, so the results do not depend
+#on the number of processes.
+#  python bootstrap.py [threshold] [replicates]
+
+import sys
+import multiprocessing
+import numpy as np
+import names_store
+import actuarial
+import weighted_stats
+import stage_timer
+
+
+STATS = ("mean", "median", "stddev", "skewness", "kurtosis")
+BLOCK_ROWS = 50000  #names x replicates resampled at a time (memory ~ BLOCK_ROWS x years x 8 bytes)
+
+
+def resample_counts(counts, replicates, random):
+    """Given a (names x years) integer counts matrix, returns a (names x replicates x years)
+    array of multinomial resamples: each replicate has the same number of babies
+    as the name, spread over the years with the observed shares.
+    The multinomial is drawn as a binomial per year of the babies still to place.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    n_names, n_years = counts.shape
+    remaining = np.repeat(counts.sum(axis=1)[:, np.newaxis], replicates, axis=1)
+    left = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1]  #babies from each year on
+
+    draws = np.zeros((n_names, replicates, n_years), dtype=np.int64)
+    for year in np.nonzero(counts.any(axis=0))[0]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(left[:, year] > 0, counts[:, year] / left[:, year].astype(float), 0.0)
+        #only draw where it is random: a name's last year gets all the babies left
+        last = share >= 1
+        drawn = (share > 0) & ~last
+        draws[last, :, year] = remaining[last]
+        draws[drawn, :, year] = random.binomial(remaining[drawn], share[drawn][:, np.newaxis])
+        remaining -= draws[:, :, year]
+
+    return draws
+
+
+def bootstrap_block(args):
+    """Pool task: bootstraps one block of names.
+    Returns (percentiles, pass_rate): percentiles[stat] is a (len(q) x names) array
+    """
+    counts, alive_prob, years, replicates, seed, block, q, max_stddev, min_kurtosis = args
+    random = np.random.RandomState([seed, block])
+
+    draws = resample_counts(counts, replicates, random)
+    number_alive = (draws * alive_prob).reshape(-1, len(years))
+    stats = weighted_stats.weighted_stats_matrix(number_alive, years)
+
+    percentiles = {}
+    with np.errstate(invalid="ignore"):
+        for stat, values in zip(STATS, stats):
+            values = values.reshape(len(counts), replicates)
+            percentiles[stat] = np.nanpercentile(values, q, axis=1)
+        passed = stats[2].reshape(len(counts), replicates) < max_stddev
+        passed &= stats[4].reshape(len(counts), replicates) > min_kurtosis
+
+    return (percentiles, passed.mean(axis=1))
+
+
+def bootstrap_stats(counts, alive_prob, years, rows=None, replicates=1000, confidence=0.95,
+                    seed=0, processes=None, max_stddev=15, min_kurtosis=0):
+    """Bootstraps the statistics of the given rows (default all) of the (names x years)
+    counts matrix, e.g. a store matrix and the rows above a threshold.
+    Returns a dict with, for each of STATS, a (low, high) tuple of arrays: the
+    confidence band (e.g. the 2.5 and 97.5 percentiles of the replicates) of every row,
+    and "pass_rate": the share of the replicates with stddev < max_stddev and
+    kurtosis > min_kurtosis (the demographics_filter criteria).
+    With processes other than 1 the blocks of names go to a pool (None = one per core);
+    the result is the same for a given seed whatever the number of processes.
+    """
+    if rows is None:
+        rows = np.arange(counts.shape[0])
+    alive_prob = np.asarray(alive_prob, dtype=float)
+    q = [50 * (1 - confidence), 50 * (1 + confidence)]
+
+    block_size = max(1, BLOCK_ROWS // replicates)
+    tasks = [(np.asarray(counts[rows[start:start + block_size]]), alive_prob, years, replicates,
+              seed, block, q, max_stddev, min_kurtosis)
+             for block, start in enumerate(range(0, len(rows), block_size))]
+
+    if processes == 1:
+        results = [bootstrap_block(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(bootstrap_block, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    bands = {}
+    for stat in STATS:
+        values = np.hstack([percentiles[stat] for percentiles, pass_rate in results] or [np.zeros((2, 0))])
+        bands[stat] = (values[0], values[1])
+    bands["pass_rate"] = np.concatenate([pass_rate for percentiles, pass_rate in results] or [np.zeros(0)])
+
+    return bands
+
+
+def main():
+
+    threshold = 400000
+    replicates = 1000
+    if len(sys.argv) > 1:
+        threshold = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        replicates = int(sys.argv[2])
+
+    if not names_store.store_exists():
+        print "Compiling baby names store (only needed once) ..."
+        names_store.compile_names_store(range(1880, 2018))
+    store = names_store.load_names_store()
+    years = store["years"].tolist()
+    timer = stage_timer.StageTimer()
+
+    for sex in ("F", "M"):
+        rows = np.nonzero(store[sex]["totals"] > threshold)[0]
+        alive_prob = actuarial.alive_prob(sex, years, reference_year=max(years))
+
+        print
+        print "Bootstrapping %d %s names above %d, %d replicates each ..." % (len(rows), sex, threshold, replicates)
+        with timer.stage(sex + " bootstrap") as stage:
+            bands = bootstrap_stats(store[sex]["counts"], alive_prob, years, rows, replicates)
+            stage["items"] = len(rows) * replicates
+
+        counts = np.asarray(store[sex]["counts"][rows])
+        point = weighted_stats.weighted_stats_matrix(counts * alive_prob, years)
+        with np.errstate(invalid="ignore"):
+            passed = (point[2] < 15) & (point[4] > 0)
+        robust = passed & (bands["pass_rate"] >= 0.95)
+        print "Pass demographics_filter: %d, in at least 95%% of the replicates: %d" % (passed.sum(), robust.sum())
+
+        print "Name, median (95% band), stddev (95% band), kurtosis (95% band), pass rate"
+        for i in np.nonzero(passed)[0]:
+            print "%s, %d (%d-%d), %0.1f (%0.1f-%0.1f), %0.2f (%0.2f-%0.2f), %0.2f" % (
+                store[sex]["names"][rows[i]], point[1][i], bands["median"][0][i], bands["median"][1][i],
+                point[2][i], bands["stddev"][0][i], bands["stddev"][1][i],
+                point[4][i], bands["kurtosis"][0][i], bands["kurtosis"][1][i], bands["pass_rate"][i])
+
+    print
+    print timer.summary()
+    print
+
+
+if __name__ == '__main__':
+  main()
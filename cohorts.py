@@ -0,0 +1,179 @@
+#Cohort binning of the name statistics
+#Cohorts are given as data: a list of (label, year) from the newest to the oldest,
+#where a name belongs to the first cohort with median birth year > year.
+#A year of None catches everything older (like the else of an if/elif ladder);
+#without it, names older than the last cohort are left out.
+#GENERATIONS are the demographics used by demographics.py; marketing cohorts
+#can be any other list, e.g. [("90s kids", 1985), ("80s kids", 1975)].
+#The stats are arrays (one value per name, e.g. a stats_table.py table),
+#every name is binned in one vectorized pass and filters are boolean masks.
+#The k best names of each cohort are picked with a partial sort (arrays) or a
+#heap of size k (streamed results), so nothing sorts the whole name universe.
+
+import heapq
+import numpy as np
+
+
+GENERATIONS = [("Gen. Z", 2000),
+               ("Millennial", 1980),
+               ("Gen. X", 1964),
+               ("Baby Boomer", 1944),
+               ("Silent Gen.", 1926),
+               ("Greatest Gen.", 1900),
+               ("Dead Gen.", None)]
+
+
+def assign_cohorts(median, cohorts=GENERATIONS):
+    """Given the median birth year of every name (array), returns an int array
+    with the position in cohorts of each name's cohort, or -1 for no cohort.
+    A nan median (nobody alive) goes to the catch all cohort, if there is one.
+    """
+    median = np.asarray(median, dtype=float)
+    bounds = [year for label, year in cohorts if year is not None]
+    if bounds != sorted(bounds, reverse=True):
+        raise ValueError("cohorts must go from the newest to the oldest")
+
+    #digitize with right=True: bounds[i-1] < median <= bounds[i] -> i, on ascending bounds
+    ascending = np.array(bounds[::-1], dtype=float)
+    with np.errstate(invalid="ignore"):
+        index = len(bounds) - np.digitize(median, ascending, right=True)
+
+    catch_all = len(bounds) if cohorts[-1][1] is None else -1
+    index[index == len(bounds)] = catch_all
+    index[np.isnan(median)] = catch_all
+
+    return index
+
+
+def filter_mask(stats, max_stddev=15, min_kurtosis=0):
+    """Returns the demographics_filter mask: a tight distribution
+    (stddev < max_stddev) best described by a single peak (kurtosis > min_kurtosis).
+    stats is a dict of arrays with "stddev" and "kurtosis". Use None to skip a criterion.
+    """
+    mask = np.ones(len(stats["stddev"]), dtype=bool)
+    with np.errstate(invalid="ignore"):  #nan never passes
+        if max_stddev is not None:
+            mask &= np.asarray(stats["stddev"]) < max_stddev
+        if min_kurtosis is not None:
+            mask &= np.asarray(stats["kurtosis"]) > min_kurtosis
+
+    return mask
+
+
+def bin_names(stats, cohorts=GENERATIONS, mask=None, score="total"):
+    """Bins every name of stats (dict of arrays with "median" and the score column)
+    into the cohorts, keeping only the names where mask is True (default all).
+    Returns a list with one array per cohort (same order as cohorts) of the
+    name rows in that cohort, ranked by score from high to low.
+    """
+    index = assign_cohorts(stats["median"], cohorts)
+    keep = index >= 0
+    if mask is not None:
+        keep &= mask
+
+    rows = np.nonzero(keep)[0]
+    scores = np.asarray(stats[score], dtype=float)[rows]
+
+    #sort by cohort, then by score from high to low (rows break ties)
+    order = np.lexsort((rows, -scores, index[rows]))
+    rows = rows[order]
+    bounds = np.searchsorted(index[rows], np.arange(len(cohorts) + 1))
+
+    return [rows[bounds[i]:bounds[i + 1]] for i in range(len(cohorts))]
+
+
+#fields of the demographics.py results tuple
+RESULT_FIELDS = ("mean", "median", "stddev", "skewness", "kurtosis", "total", "alive")
+
+
+def stats_from_results(results_dict):
+    """Converts the demographics.py results dict name: (mean, median, stddev, sk, kurt, total, alive)
+    to a tuple (names, stats) where stats is a dict of arrays, one value per name
+    """
+    names = list(results_dict)
+    values = np.array([results_dict[name] for name in names], dtype=float)
+    values = values.reshape(len(names), len(RESULT_FIELDS))
+    stats = dict((column, values[:, i]) for i, column in enumerate(RESULT_FIELDS))
+
+    return (names, stats)
+
+
+#scores to rank names by, given a dict of stats (numbers or arrays):
+#  total     - number of babies of all time
+#  alive     - number expected to be alive today
+#  sharpness - people alive per year of spread (alive / stddev), popular and narrow
+SCORES = {"total": lambda stats: stats["total"],
+          "alive": lambda stats: stats["alive"],
+          "sharpness": lambda stats: stats["alive"] / stats["stddev"]}
+
+
+def result_score(result, score):
+    """Score of one demographics.py results tuple"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = SCORES[score](dict(zip(RESULT_FIELDS, result)))
+    if np.isnan(value):
+        return -np.inf  #ranked last
+
+    return value
+
+
+def cohort_of(median, cohorts=GENERATIONS):
+    """Scalar version of assign_cohorts() for one median"""
+    for index, (label, year) in enumerate(cohorts):
+        if year is None or median > year:
+            return index
+        if np.isnan(median):
+            break
+
+    return len(cohorts) - 1 if cohorts[-1][1] is None else -1
+
+
+def top_k(results, k, score="alive"):
+    """Returns the k best (name, result) pairs of results (any iterable,
+    e.g. results_dict.iteritems() or a generator) by score, best first.
+    Uses a heap, so the cost is O(n log k).
+    """
+    return heapq.nlargest(k, results, key=lambda item: (result_score(item[1], score), item[0]))
+
+
+def top_k_stream(results, k, cohorts=GENERATIONS, score="alive"):
+    """Streaming version of top_k per cohort: results is an iterable of
+    (name, results tuple) pairs, read once, keeping a heap of size k per cohort.
+    Returns a list with one list per cohort of the k best (name, result) pairs, best first.
+    """
+    heaps = [[] for cohort in cohorts]
+    for name, result in results:
+        index = cohort_of(result[1], cohorts)
+        if index < 0:
+            continue
+        item = (result_score(result, score), name, result)
+        if len(heaps[index]) < k:
+            heapq.heappush(heaps[index], item)
+        elif item > heaps[index][0]:
+            heapq.heapreplace(heaps[index], item)
+
+    return [[(name, result) for value, name, result in sorted(heap, reverse=True)]
+            for heap in heaps]
+
+
+def top_k_per_cohort(stats, k, cohorts=GENERATIONS, mask=None, score="alive"):
+    """Array version of top_k_stream: stats is a dict of arrays (e.g. a stats_table.py table).
+    Returns a list with one array per cohort of the rows of the k best names, best first.
+    Each cohort uses a partial sort (np.argpartition), O(n + k log k).
+    """
+    index = assign_cohorts(stats["median"], cohorts)
+    keep = index >= 0
+    if mask is not None:
+        keep &= mask
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.asarray(SCORES[score](stats), dtype=float)
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+
+    top = []
+    for i in range(len(cohorts)):
+        rows = np.nonzero(keep & (index == i))[0]
+        if len(rows) > k:
+            rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        top.append(rows[np.lexsort((rows, -scores[rows]))])
+
+    return top
@@ -3,199 +3,181 @@
 #Results only include those who registered with SSA at birth
 
 # This program does the following:
-# 1) Imports all SSA baby names from files into a dictionary.
-#    Two dictionaries (M and F) are used throughout the program.
+# 1) Imports all SSA baby names from files, as columns of name IDs, years and counts
+#    (or loads the compiled store, see names_store.py). M and F are kept apart.
 # 2) Identifies the number of unique names in the SSA database 
-#    and creates a dictionary of all unique names
-# 3) Patches the SSA names dictionaries to fill in missing data.
+#    (the name IDs are numbered while the files are read)
+# 3) Stores the counts as sparse arrays (only the years a name appears in),
+#    built straight from those columns, instead of year dictionaries patched
+#    with zeros for the missing years.
 # 4) Imports the 2014 actuarial table generated using get_actdata_2014.py
-#    and calculates the number expected to be alive in 2017.
+#    and calculates the number expected to be alive in 2017
+#    (with the compiled store the saved statistics table has it, see stats_table.py).
 # 5) Asks the user for a threshold cutoff value.
 #    Only names with a total number of people ever born
 #    exceeding the threshold will be looked at.  
-#    In the future, this step could be done before patching the dictionary to save time
+#    The totals are known before any name is expanded to all years,
+#    so only the selected names go through the rest of the analysis.
 # 6) The program then proceeds with the "Main analysis" which examines all
 #    above threshold names and runs the statistics for those expected to be alive.
 # 7) These names are then placed in to different demographics
 #    based on their median value
 # 8) This set is filtered for narrow distributions (std dev < 15 years)
 #    and which can be well described by a single peak (kurtosis > 0)
-# 9) This subset of names in each demographic are sorted by rank and printed to the screen.
+# 9) The top 25 names of this subset in each demographic (--top K for more or fewer)
+#    are ranked by the number alive today and printed to the screen.
+#10) Prints the time and memory of every stage and saves them to demographics_report.json
+#    (see stage_timer.py). Any stage can be profiled: python demographics.py --profile "F analysis"
 
 #Adrian Swartz June 2018
 
-import re
+import os
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-import csv
-import scipy.stats as st
-
-
-
-def get_allnames_year(year):
-    """Given an integer year as input, opens the file in directory /names with file: "yob1999.txt",
-    returns a dict tuple (Female, Male) where the keywords are the name
-    and the value is the associated number of names for that year
-    """
-    #initialize Male and Female dictionaries
-    singleyear_F_dict = {}
-    singleyear_M_dict = {}
-
-    #identify filename for that year
-    filename = "names/yob" + str(year) + ".txt"
-
-    #initialize counter for number of males and females born that year
-    count_F = 0
-    count_M = 0
-
-    #read file and separate into two dictionaries by sex
-    with open(filename) as f:
-        for i, line in enumerate(f):
-            #print("Line {}: {}".format(i, line))
-            n_tuple = re.findall(r'(\w+),(\w),(\d+)', line)
-
-            name = n_tuple[0][0]
-            sex = n_tuple[0][1]
-            number = int(n_tuple[0][2])
-            
-            if sex == "F":
-                singleyear_F_dict[name] = number
-                count_F += 1
-            else:
-                singleyear_M_dict[name] = number
-                count_M += 1
-            
-#    print
-#    print 'From %4d\n' %year
-#    print "Number of lines: ", i
-#    print "Number of M names: ", count_M
-#    print "Number of F names: ", count_F
-#    print
-            
-    #Return a tuple of two dictionaries for the male and female names
-    return (singleyear_M_dict, singleyear_F_dict)
-
-def build_allyears_dict(years):
-    """Given a list of years (integers) as input, calls the
-    get_allnames_year(year) function. 
+import names_store
+import actuarial
+import weighted_stats
+import stats_table
+import cohorts
+import stage_timer
+
+
+REPORT_FILE = "demographics_report.json"  #stage timings of the last run
+TOP_K = 25  #characteristic names printed for each demographic
+
+
+#The original program read the files into one dictionary per year and patched them
+#with a zero for every (year, name) pair which does not occur, that is ~100k names
+#x 138 years of mostly zeros in memory (see baseline.py).
+#The sparse version only stores the pairs that are in the SSA data,
+#sorted by name (CSR layout), and fills in zeros only when asked:
+#  sparse["names"]      - list of names, the row of each name
+#  sparse["indptr"]     - the entries of row i are indptr[i]:indptr[i+1]
+#  sparse["year_index"] - year of each entry (position in years)
+#  sparse["counts"]     - number of babies of each entry
+#It is built by names_store.read_year_entries straight from the parsed columns,
+#so no dictionary of the years (one Python object per name and year) is ever made.
+
+def read_sparse_counts(years):
+    """Reads the SSA files of the years (names/yobYYYY.txt) into a tuple of
+    sparse dicts (Male, Female) as described above. The files are parsed by
+    a pool of worker processes, one per core.
     """
-    
-    #initialize Male and Female dictionaries
-    years_F_dict = {}
-    years_M_dict = {}
-    for year in years:
-        singleyear_M_dict, singleyear_F_dict = get_allnames_year(year)
-        years_M_dict[year] = singleyear_M_dict
-        years_F_dict[year] = singleyear_F_dict
-    
-  
-    return (years_M_dict, years_F_dict)
-
-
-#The dictionary has holes, which need to be filled
-#There are names which do not appear in all years,
-#therefore calling the dict for a single name over all years
-#would generate a list of different lengths for each name
-#To patch the dictionary, it helps to know every name:
+    filenames = [os.path.join(names_store.NAMES_DIR, "yob" + str(year) + ".txt") for year in years]
+    lines, entries = names_store.read_year_entries(filenames, processes=None)
 
-def extract_allnames(years, years_dict):
-
-    names = {} #initialize dict
-    #faster to access than a list and solves the duplicates problem
-    #if duplicates included, there can be over 1 million entries
-    #should only be about 67 thousand total female names in the SSA data
-
-    for year in years:
-        for name in years_dict[year].keys():
-            names[name] = name
-                
-    return names #a dictionary of all uniqe names in SSA baby data
-
-#Now I can fill the holes for years which are missing data for that name
-
-def patch_years_dict(years_dict, names_dict, years):
-    for name in names_dict:
-        for year in years_dict:
-            if name not in years_dict[year]:
-                years_dict[year][name] = 0
-
-    return years_dict
+    sparse = {}
+    for sex in ("F", "M"):
+        names, indptr, year_index, counts = entries[sex]
+        sparse[sex] = {"names": names, "indptr": indptr, "year_index": year_index,
+                       "counts": counts, "n_years": len(years)}
 
+    return (sparse["M"], sparse["F"])
 
 
+def densify(sparse, rows):
+    """Returns the dense int32 (names x years) matrix of the given rows (array of
+    name rows) of the sparse dict, with zeros filled in for the missing years
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = sparse["indptr"][rows]
+    lengths = sparse["indptr"][rows + 1] - starts
 
-def extract_name_numbers(name, years, patched_dict):
-    numbers = [] #initialize
-    for year in years:
-        numbers.append(patched_dict[year][name])
+    #position of every entry of the selected rows in the sparse arrays
+    dense_rows = np.repeat(np.arange(len(rows)), lengths)
+    entries = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    entries += np.repeat(starts, lengths)
 
-    return numbers
+    dense = np.zeros((len(rows), sparse["n_years"]), dtype=np.int32)
+    dense[dense_rows, sparse["year_index"][entries]] = sparse["counts"][entries]
 
+    return dense
 
-def quick_sum(name, years, patched_dict):
 
-    total = 0
-    for year in years:
-        total += patched_dict[year][name]
+def sparse_totals(sparse):
+    """Returns the all time number of babies of every name of the sparse dict,
+    without filling in any zeros
+    """
+    indptr = sparse["indptr"]
+    totals = np.zeros(len(sparse["names"]), dtype=np.int64)
+    rows = np.diff(indptr) > 0  #reduceat can't sum an empty row
+    #summed as int32, like the counts (an int64 sum would first copy every entry);
+    #all the babies ever given one name are far fewer than 2**31
+    totals[rows] = np.add.reduceat(sparse["counts"], indptr[:-1][rows], dtype=np.int32)
 
-    return total
+    return totals
 
 
-def open_actuarial_data(sex, years):
+def open_actuarial_data(sex, years, reference_year=None):
     """ Opens the adjusted 2014 actuarial table.
     Imports only the data spanning the input years (list of integers)
     Imports only the probability to be alive in 2017 for sex ="M" or "F".
-    The actuarial file has years, M_dp, M_le, M_notdead, M_alive_prob, F_dp, ...
+    (or in reference_year, if given, e.g. after adding a newer year of SSA data)
+    The table is parsed once and shared, see actuarial.py
     """
-    filename = "adj_act_data_2014.txt"  #file generated using get_actdata_2014.py
-
-    all_data = []
-
-    with open(filename) as f:
-      text = csv.reader(f)   
-      for line in text:
-        all_data.append(line)
-
-    #I discovered the csv reader after I had already
-    #written the get_singlename_year() function
-    
-    alive_prob = []
-    shift = min(years) - 1880
-    for index, item in enumerate(years):
-      index +=shift
-      if sex == "M":
-        #Male alive prob. data is stored in column 4 of actuary file
-        alive_prob.append(float(all_data[index][4]))  
-      elif sex == "F":
-        #Female alive prob. data is stored in column 8 of actuary file
-        alive_prob.append(float(all_data[index][8]))
-      else:
+    if sex not in ("M", "F"):
         print "Neither F or M chosen"
         return False
 
+    #a read only view of the table, no copy
+    alive_prob = actuarial.alive_prob(sex, years, reference_year=reference_year)
 
     return alive_prob  #returns the probability of being alive in 2017
 
 
 
 def get_stats(number_alive, years):
+    """Returns (mean, median, stddev, skewness, kurtosis) of the birth years
+    of those alive, computed directly from the number_alive weights
+    (see weighted_stats.py) instead of expanding them into a histogram.
+    """
+    return weighted_stats.weighted_stats(number_alive, years) #a tuple
+
 
-    data = []  # convert number_alive vs years into a histogram for stats analysis
-    for index, value in enumerate(number_alive):
-        i = 0
-        while i < value:
-          data.append(years[index])
-          i+=1
+def get_stats_all_names(counts, alive_prob, years, rows=None, chunk_size=4096):
+    """Batch version of get_stats for many names at once, from the baby counts to the statistics.
+    counts is the (names x years) matrix, or the sparse dict from read_sparse_counts(),
+    and alive_prob the actuarial list for one sex.
+    rows are the name rows to analyse (default all names); only these are made dense,
+    chunk_size rows at a time so the float temporaries stay small.
+    Returns the tuple of arrays (mean, median, stddev, skewness, kurtosis, alive),
+    one value per row, where alive is the number of people expected to be alive.
+    """
+    alive_prob = np.asarray(alive_prob, dtype=float)
+    if rows is None:
+        if isinstance(counts, dict):
+            rows = np.arange(len(counts["names"]))
+        else:
+            rows = np.arange(counts.shape[0])
 
-    mean = np.mean(data)
-    median = np.median(data)
-    stddev = np.std(data)
-    sk = st.skew(data)
-    kurt = st.kurtosis(data)
+    stats = tuple(np.zeros(len(rows)) for i in range(6))
 
-#    print st.describe(data)
-    
-    return (mean, median, stddev, sk, kurt) #a tuple
+    for start in range(0, len(rows), chunk_size):
+        stop = min(start + chunk_size, len(rows))
+        if isinstance(counts, dict):
+            block = densify(counts, rows[start:stop])
+        else:
+            block = counts[rows[start:stop]]
+
+        number_alive = block * alive_prob
+        block_stats = weighted_stats.weighted_stats_matrix(number_alive, years)
+        block_stats += (number_alive.sum(axis=1),)
+        for stat, block_stat in zip(stats, block_stats):
+            stat[start:stop] = block_stat
+
+    return stats
+
+
+def make_results_dict(names, rows, totals, stats):
+    """Given the analysed name rows and their stats from get_stats_all_names(),
+    returns the results dict name: (mean, median, stddev, sk, kurt, total, alive)
+    """
+    results_dict = {}
+    for index, row in enumerate(rows):
+        mean, median, stddev, sk, kurt, alive = [stat[index] for stat in stats]
+        results_dict[names[row]] = (mean, median, stddev, sk, kurt, int(totals[row]), alive)
+
+    return results_dict
 
 
 # This is already a more powerful way to handle the data.
@@ -207,49 +189,23 @@ def get_stats(number_alive, years):
 
 
 
-def demographics_analysis(results_dict):
+def demographics_analysis(results_dict, groups=cohorts.GENERATIONS):
 
-    demo_groups = [] #dicts will go in here
-    gen_z = {}
-    millennials = {}
-    gen_x = {}
-    baby_boomers = {}
-    silent_gen = {}
-    greatest_gen = {}
-    greatest_gen = {}
-    dead_gen = {}
-
-    
-    # start with simple demographics splitting by median
+    # simple demographics splitting by median
     # not worrying about std dev, skewness, or kurtosis.
-    for name in results_dict:
-        median_age = results_dict[name][1]
-        if median_age > 2000 :
-            gen_z[name] = results_dict[name]
-        elif median_age > 1980: 
-            millennials[name] = results_dict[name]
-        elif median_age > 1964:
-            gen_x[name] = results_dict[name]
-        elif median_age > 1944:
-            baby_boomers[name] = results_dict[name]
-        elif median_age > 1926:
-            silent_gen[name] = results_dict[name]
-        elif median_age > 1900:
-            greatest_gen[name] = results_dict[name]
-        else:
-            dead_gen[name] = results_dict[name]
+    # The groups (generations by default) are data, see cohorts.py,
+    # and all names are binned in one vectorized pass.
+    names, stats = cohorts.stats_from_results(results_dict)
+    index = cohorts.assign_cohorts(stats["median"], groups)
 
-    demo_groups.append(gen_z)
-    demo_groups.append(millennials)
-    demo_groups.append(gen_x)
-    demo_groups.append(baby_boomers)
-    demo_groups.append(silent_gen)
-    demo_groups.append(greatest_gen)
-    demo_groups.append(dead_gen)
+    demo_groups = [{} for group in groups] #dicts will go in here
+    for name, group in zip(names, index):
+        if group >= 0:
+            demo_groups[group][name] = results_dict[name]
 
     return demo_groups
 
-def demographics_filter(demo_groups):
+def demographics_filter(demo_groups, max_stddev=15, min_kurtosis=0):
     #demo_groups is a list of dicts
     filtered_demo_groups = []
     
@@ -259,158 +215,154 @@ def demographics_filter(demo_groups):
     #(meaning there's one well defined peak that isn't too wide)
     
     for demo_dict in demo_groups:
+        names, stats = cohorts.stats_from_results(demo_dict)
+        mask = cohorts.filter_mask(stats, max_stddev, min_kurtosis)
         filtered_dict = {}
-        for name in demo_dict:
-            median_age = demo_dict[name][1]
-            std_dev = demo_dict[name][2]
-            kt = demo_dict[name][4]
-        
-            if std_dev < 15 and kt > 0:
+        for name, keep in zip(names, mask):
+            if keep:
                 filtered_dict[name] = demo_dict[name]
         filtered_demo_groups.append(filtered_dict)
  
 
     return filtered_demo_groups
-        
-def Last(a):
-  return a[-1]
-    
-def main():
-
-    years = range(1880,2018)
 
-    print
-    print "Reading baby names data from SSA files ... ... ..."
-    print
+def main(report_file=REPORT_FILE, profile=(), top_k=TOP_K):
+    """Runs the analysis, timing every stage (see stage_timer.py).
+    The top_k characteristic names of each demographic are printed.
+    The timings are printed at the end and saved to report_file (None to skip);
+    the stages named in profile are also run under cProfile.
+    """
 
-    #create Male, Female dictionaries from raw data in SSA baby files
-    years_M_dict, years_F_dict = build_allyears_dict(years)
+    timer = stage_timer.StageTimer(profile)
+    years = range(1880,2018)
+    table = None  #precomputed statistics, only with the compiled store
 
-    print
-    print "... done reading files!"
-    print
+    if names_store.store_exists():
+        print
+        print "Loading compiled baby names store ..."
+        print
 
-    print
-    print "Extract all unique names..."
-    print
+        with timer.stage("load store") as stage:
+            #memory-mapped store, no text parsing needed
+            store = names_store.load_names_store()
+            years = store["years"].tolist()  #every year in the store, including years appended since
+            names_F = store["F"]["names"]
+            names_M = store["M"]["names"]
+            stage["items"] = len(names_F) + len(names_M)
+
+        with timer.stage("stats table") as stage:
+            #statistics of every name, computed once and saved with the store,
+            #so the counts, totals and actuarial table are not needed here
+            table = stats_table.load_or_build_stats_table()
+            stage["items"] = len(table["F"]["total"]) + len(table["M"]["total"])
+
+        print "Total number of unique Female names: ", len(names_F)
+        print "Total number of unique Male names: ", len(names_M)
+        print
 
- 
-    #create dictionary containing all unique names in SSA baby names database
-    names_F = extract_allnames(years, years_F_dict)
-    names_M = extract_allnames(years, years_M_dict)
+    else:
+        print
+        print "Reading baby names data from SSA files ... ... ..."
+        print
 
-    print    
-    print "Total number of unique Female names: ", len(names_F) 
-    print "Total number of unique Male names: ", len(names_M)
-    print
+        with timer.stage("read files") as stage:
+            #columns of name IDs, years and counts from raw data in SSA baby files,
+            #stored as sparse arrays (one worker process per core)
+            counts_M, counts_F = read_sparse_counts(years)
+            names_F = counts_F["names"]
+            names_M = counts_M["names"]
+            stage["items"] = len(counts_F["counts"]) + len(counts_M["counts"])  #lines read
 
-    print
-    print "Patching holes in the dictionary..."
-    print
+        print
+        print "... done reading files!"
+        print
 
-    #Patch the dictionaries with zeros
-    patched_F_dict = patch_years_dict(years_F_dict, names_F, years)
-    patched_M_dict = patch_years_dict(years_M_dict, names_M, years)
+        print    
+        print "Total number of unique Female names: ", len(names_F) 
+        print "Total number of unique Male names: ", len(names_M)
+        print
 
-    print
-    print "... patched!"
-    print
+        with timer.stage("totals") as stage:
+            #all time number of babies of every name, no zeros filled in
+            totals_F = sparse_totals(counts_F)
+            totals_M = sparse_totals(counts_M)
+            stage["items"] = len(names_F) + len(names_M)
 
-    print
-    print "Compile actuarial tables..."
-    print
+        print
+        print "Compile actuarial tables..."
+        print
 
-    alive_prob_F = open_actuarial_data("F", years)
-    alive_prob_M = open_actuarial_data("M", years)
+        with timer.stage("actuarial") as stage:
+            alive_prob_F = open_actuarial_data("F", years, reference_year=max(years))
+            alive_prob_M = open_actuarial_data("M", years, reference_year=max(years))
+            stage["items"] = 2 * len(years)
 
-    print
-    print "... done!"
-    print
+        print
+        print "... done!"
+        print
 
     
     print "Minimum number of people with that name over time."
     print "(Threshold value, i.e. 400000)"
     threshold = raw_input("Please enter a number: " )
     threshold = int(threshold)
-    count = 0
-    results_dict_F = {} #initialize
     
     print
     print "Begin analysis of all Female names with minimum %d total instances" %threshold
-    print "... takes about 1 min, please be patient ..."
-    
-    #Calculate number_alive using the actuarial table
-    #Then get the statistics using the get_stats function
-    for name in names_F:
-        sex = "F"
-        total = quick_sum(name, years, patched_F_dict)
-        if total > threshold:
-#            print name, total
-            count +=1
-            #Get baby numbers for name and sex="F"
-            name_data = extract_name_numbers(name, years, patched_F_dict)
-        
-
-            number_alive = name_data[:] #initialize, mainly for length
-            for index, num in enumerate(name_data):  
-                number_alive[index] = name_data[index] * alive_prob_F[index]
-
-
-            
-            mean, median, stddev, sk, kurt = get_stats(number_alive, years)
-            results_dict_F[name] = (mean, median, stddev, sk, kurt, total)
     
+    with timer.stage("F analysis") as stage:
+        if table is not None:
+            #the statistics are precomputed, the threshold is only a filter
+            rows_F = stats_table.select(table, "F", threshold)
+            results_dict_F = stats_table.results_dict(table, "F", rows_F, names_F)
+        else:
+            #Select the names above threshold from the totals first,
+            #then calculate number_alive using the actuarial table
+            #and get the statistics for the selected names only
+            rows_F = np.nonzero(totals_F > threshold)[0]
+            stats_F = get_stats_all_names(counts_F, alive_prob_F, years, rows_F)
+            results_dict_F = make_results_dict(names_F, rows_F, totals_F, stats_F)
+        stage["items"] = len(results_dict_F)
+    count = len(results_dict_F)
 
     print
     print "Number of Female names exceeding %d throughout history: %d" %(threshold, count)
 
-    count = 0
-    results_dict_M = {} #initialize
-    
     print
     print "Begin analysis of all Male names with minimum %d total instances" %threshold
-    print "... takes about 1 min, please be patient ..."
     
-    for name in names_M:
-        sex = "M"
-        total = quick_sum(name, years, patched_M_dict)
-        if total > threshold:
-#            print name, total
-            count +=1
-            #Get baby numbers for name and sex="M"
-            name_data = extract_name_numbers(name, years, patched_M_dict)
-        
-
-            number_alive = name_data[:] #initialize, mainly for length
-            for index, num in enumerate(name_data):  
-                number_alive[index] = name_data[index] * alive_prob_M[index]
-
-
-            
-            mean, median, stddev, sk, kurt = get_stats(number_alive, years)
-            results_dict_M[name] = (mean, median, stddev, sk, kurt, total)
-        
-
-
-
+    with timer.stage("M analysis") as stage:
+        if table is not None:
+            rows_M = stats_table.select(table, "M", threshold)
+            results_dict_M = stats_table.results_dict(table, "M", rows_M, names_M)
+        else:
+            rows_M = np.nonzero(totals_M > threshold)[0]
+            stats_M = get_stats_all_names(counts_M, alive_prob_M, years, rows_M)
+            results_dict_M = make_results_dict(names_M, rows_M, totals_M, stats_M)
+        stage["items"] = len(results_dict_M)
+    count = len(results_dict_M)
 
     print
     print "Number of Male names exceeding %d throughout history: %d" %(threshold, count)
     print
     print "\033[1;31mPrimary analysis Complete! Yay!\033[1;m"
 
-    demo_groups_F = demographics_analysis(results_dict_F)
-    demo_groups_M = demographics_analysis(results_dict_M)
+    with timer.stage("binning") as stage:
+        demo_groups_F = demographics_analysis(results_dict_F)
+        demo_groups_M = demographics_analysis(results_dict_M)
+        stage["items"] = len(results_dict_F) + len(results_dict_M)
     # This list of dicts has all the information we are looking for!
     # Each list represents a demographic containting a dictionary of
-    # names with associated (mean, median, stddev, skewness, and kurtosis)
+    # names with associated (mean, median, stddev, skewness, kurtosis, total and number alive)
     # The subset of names in these demographics are filtered by two concepts:
     # 1) Popularity - the threshold value
     # 2) Likelyhood to still be alive in 2017
 
 
-    filtered_groups_F = demographics_filter(demo_groups_F)
-    filtered_groups_M = demographics_filter(demo_groups_M)
+    with timer.stage("filtering") as stage:
+        filtered_groups_F = demographics_filter(demo_groups_F)
+        filtered_groups_M = demographics_filter(demo_groups_M)
+        stage["items"] = len(results_dict_F) + len(results_dict_M)
     # The subset of names in these demographics are filtered an additional two concepts:
     # 1) narrow distribution of names - std_dev < 15 years
     # 2) AND best described by one peak, kurtosis > 0.
@@ -431,50 +383,72 @@ def main():
 
 
     ##Print the results
+    #the top_k names of each demographic by the number expected to be alive today (value[6]),
+    #picked with a partial sort of the stats table, or else a heap, rather than
+    #sorting every name (see cohorts.py)
+    ranked_groups = {}
+    for sex, rows, names, results_dict, filtered_groups in (
+            ("F", rows_F, names_F, results_dict_F, filtered_groups_F),
+            ("M", rows_M, names_M, results_dict_M, filtered_groups_M)):
+        if table is not None:
+            stats = dict((column, table[sex][column][rows]) for column in stats_table.COLUMNS)
+            top = cohorts.top_k_per_cohort(stats, top_k, mask=cohorts.filter_mask(stats))
+            ranked_groups[sex] = [[(names[rows[i]], results_dict[names[rows[i]]]) for i in top_rows]
+                                  for top_rows in top]
+        else:
+            ranked_groups[sex] = [cohorts.top_k(group.iteritems(), top_k, "alive") for group in filtered_groups]
+
     i=0
     while i < len(filtered_groups_F):
         print
         print
-        if i==0:
-            print "\033[1;31mCharacteristic Gen. Z names!\033[1;m"
-        elif i==1:
-            print "\033[1;31mCharacteristic Millennial names!\033[1;m"
-        elif i==2:
-            print "\033[1;31mCharacteristic Gen. X names!\033[1;m"
-        elif i==3:
-            print "\033[1;31mCharacteristic Baby Boomer names!\033[1;m"
-        elif i==4:
-            print "\033[1;31mCharacteristic Silent Gen. names!\033[1;m"
-        elif i==5:
-            print "\033[1;31mCharacteristic Greatest Gen. names!\033[1;m"
-        elif i==6:
-            print "\033[1;31mCharacteristic Dead Gen. names!\033[1;m"
+        print "\033[1;31mCharacteristic %s names!\033[1;m" % cohorts.GENERATIONS[i][0]
 
 
+        print "Top %d by number alive today" % top_k
         print "Name, Sex, Age, number alive today"
-        rank = 1
-        for name, value in sorted(filtered_groups_F[i].items(), key=lambda x: x[1][-1], reverse=True):
+        ranked_F = ranked_groups["F"][i]
+        for rank, (name, value) in enumerate(ranked_F, 1):
             sex = 'F'
             age = max(years) - int(value[0])
-            print '%d. %s, %s, %d, %d' %(rank, name, sex, age, value[-1])
-            rank +=1
-        if sorted(filtered_groups_F[i].items()) == []:
+            print '%d. %s, %s, %d, %d' %(rank, name, sex, age, value[6])
+        if not ranked_F:
             print 'F: NONE'
             
         print 
-        rank = 1
-        for name, value in sorted(filtered_groups_M[i].items(), key=lambda x: x[1][-1], reverse=True):
+        ranked_M = ranked_groups["M"][i]
+        for rank, (name, value) in enumerate(ranked_M, 1):
             sex = 'M'
             age = max(years) - int(value[0])
-            print '%d. %s, %s, %d, %d' %(rank, name, sex, age, value[-1])
-            rank +=1
-        if sorted(filtered_groups_M[i].items()) == []:
+            print '%d. %s, %s, %d, %d' %(rank, name, sex, age, value[6])
+        if not ranked_M:
             print 'M: NONE'
         i+=1
         if i > 10:
-            return None
-    
+            break
+
+    print
+    print
+    print "Time and memory of each stage:"
+    print timer.summary()
+    if report_file is not None:
+        timer.save(report_file)
+        print "(saved to %s)" % report_file
+    print
 
 
 if __name__ == '__main__':
-  main()
+  #python demographics.py [--report report.json] [--profile "F analysis"] [--top 25] ...
+  args = sys.argv[1:]
+  options = {"report_file": REPORT_FILE, "profile": [], "top_k": TOP_K}
+  while args:
+      option = args.pop(0)
+      if option == "--report" and args:
+          options["report_file"] = args.pop(0)
+      elif option == "--profile" and args:
+          options["profile"].append(args.pop(0))
+      elif option == "--top" and args and args[0].isdigit():
+          options["top_k"] = int(args.pop(0))
+      else:
+          sys.exit("usage: python demographics.py [--report FILE] [--profile STAGE] [--top K] ...")
+  main(**options)
@@ -9,6 +9,7 @@
 
 import re
 import urllib
+import numpy as np
 import matplotlib.pyplot as plt
 
 
@@ -85,6 +86,18 @@ def dict_to_arrays(act_table_dict):
 
 
 
+def survival_probability(death_prob):
+    """Given the probability of dying at each age (0, 1, 2, ...),
+    returns the probability of still being alive at each age,
+    i.e. the cumulative product of (1 - death probability) from age 0 up to that age.
+    death_prob can be a list, or an array with ages along the last axis
+    (e.g. [M_dp, F_dp], or one row per calendar year) to do many tables at once.
+    Tables can have any number of ages.
+    """
+    notdead = 1 - np.asarray(death_prob, dtype=float)
+    return np.cumprod(notdead, axis=-1)
+
+
 def fixed_actuarial_data(act_table_dict, years):
     """ To use death table with 1880-2017 baby names data from SSA,
     need to map 0 to 119 ages --> 2017 to 2017-119.
@@ -107,35 +120,13 @@ def fixed_actuarial_data(act_table_dict, years):
     F_dp = data[3]
     F_le = data[4]
 
-    #Male data first:
     #probability of not dying that year
-    M_notdead = M_dp[:]   #initialize
-    for index, mdp in enumerate(M_dp):
-      M_notdead[index] = 1 - mdp  
-
-
-    #calculate probability alive in 2017
-    M_alive_prob = M_notdead[:]     #initialize
-    for index, mnd in enumerate(M_notdead):
-      count = index-1
-      M_alive_prob[index] = mnd
-      while count > 0:
-        M_alive_prob[index] *= M_notdead[count]
-        count-=1
-      
-    #Same thing for the female data:
-    F_notdead = F_dp[:]
-    for index, fdp in enumerate(F_dp):
-      F_notdead[index] = 1 - fdp    #probability of not dying that year
-
-    #calculate probability alive in 2017
-    F_alive_prob = F_notdead[:]
-    for index, mnd in enumerate(F_notdead):
-      count = index-1
-      F_alive_prob[index] = mnd
-      while count > 0:
-        F_alive_prob[index] *= F_notdead[count]
-        count-=1
+    M_notdead = [1 - mdp for mdp in M_dp]
+    F_notdead = [1 - fdp for fdp in F_dp]
+
+    #calculate probability alive in 2017, both sexes at once
+    #(the product now includes the age 0 factor, which the old loop skipped)
+    M_alive_prob, F_alive_prob = survival_probability([M_dp, F_dp]).tolist()
 
     #reverse ages with zero at the max of years
     #actuary table is from 2014, but we will assume that this is
@@ -143,6 +134,11 @@ def fixed_actuarial_data(act_table_dict, years):
     for index, age in enumerate(ages):
       ages[index] = max(years)-age
 
+    #a table with more ages than years is cut at the first year
+    del ages[len(years):], M_dp[len(years):], M_le[len(years):], M_notdead[len(years):]
+    del M_alive_prob[len(years):], F_dp[len(years):], F_le[len(years):], F_notdead[len(years):]
+    del F_alive_prob[len(years):]
+
     #kill off everyone over 120 (no extrapolation) 
     i = min(ages)-1  
     while len(ages) < len(years):
@@ -185,7 +181,7 @@ def fixed_actuarial_data(act_table_dict, years):
     return adj_data
 
 
-def write_actdata_file(fixed_data):
+def write_actdata_file(fixed_data, filename="adj_act_data_2014.txt"):
 
     ages = fixed_data[0]
     M_dp = fixed_data[1]
@@ -197,7 +193,7 @@ def write_actdata_file(fixed_data):
     F_notdead = fixed_data[7]
     F_alive_prob = fixed_data[8]
     
-    f= open("adj_act_data_2014.txt","w+")
+    f= open(filename,"w+")
     for index, age in enumerate(ages):
         s = str(age) + ", "
         s += str(M_dp[index]) + ", "
@@ -0,0 +1,237 @@
+#Number of peaks of the age distribution of every name
+#A single mean and std. dev. do not describe a name which came back into fashion
+#(popular in the 1910s and again in the 2000s), and demographics_filter only uses
+#kurtosis > 0 as a proxy for "one well defined peak". This module finds the peaks
+#of every name's number_alive distribution directly, for the whole (names x years)
+#matrix at once:
+#  find_peaks_matrix - smooths each row (Gaussian, a few years wide), takes the local
+#                      maxima and keeps those with a large enough prominence (height
+#                      above the higher of the two lowest points separating the peak
+#                      from a higher one, as scipy.signal.peak_prominences)
+#  fit_mixture       - fits a Gaussian mixture of a few components to every row with
+#                      EM, started at the peaks; every EM step is array operations
+#                      over a block of names, there is no loop over names
+#  python multimodal.py [threshold] prints the names with more than one peak.
+
+import sys
+import numpy as np
+import scipy.ndimage
+import names_store
+import actuarial
+import stage_timer
+
+
+def smooth_rows(weights, smooth=3):
+    """Gaussian smoothing along the years (smooth = std. dev. in years, 0 for none)"""
+    weights = np.asarray(weights, dtype=float)
+    if smooth <= 0:
+        return weights
+    return scipy.ndimage.gaussian_filter1d(weights, smooth, axis=1, mode="nearest")
+
+
+def peak_prominences(values, rows, columns):
+    """Prominence of the peaks at values[rows, columns], all at once:
+    walks left and right from every peak (one step for all the peaks together) until
+    a higher value or the edge, keeping the lowest value seen on each side.
+    Unlike scipy the values are taken as 0 beyond the edges (no births before the
+    first year, nobody born after the last), so a name still rising at the end of
+    the years has a peak there.
+    """
+    n_years = values.shape[1]
+    height = values[rows, columns]
+    bases = []
+    for step in (-1, 1):
+        lowest = height.copy()
+        walking = np.ones(len(rows), dtype=bool)
+        for distance in range(1, n_years + 1):
+            position = columns + step * distance
+            inside = (position >= 0) & (position < n_years)
+            lowest[walking & ~inside] = 0
+            walking &= inside
+            if not walking.any():
+                break
+            value = values[rows[walking], position[walking]]
+            higher = value > height[walking]
+            still = np.nonzero(walking)[0]
+            lowest[still[~higher]] = np.minimum(lowest[still[~higher]], value[~higher])
+            walking[still[higher]] = False
+        bases.append(lowest)
+
+    return height - np.maximum(bases[0], bases[1])
+
+
+def find_peaks_matrix(weights, years, smooth=3, min_prominence=0.2):
+    """Finds the peaks of every row of a (names x years) weights matrix (e.g. number_alive).
+    A peak must have a prominence of at least min_prominence times the row's maximum
+    (after smoothing). Returns a dict with:
+      "n_peaks"    - number of peaks of each row (0 for rows without weight)
+      "peak_years" - (rows x most peaks) years of the peaks, most prominent first, nan padded
+      "prominence" - their prominence as a fraction of the row maximum, nan padded
+    """
+    years = np.asarray(years, dtype=float)
+    values = smooth_rows(weights, smooth)
+    n_rows, n_years = values.shape
+
+    #local maxima; the edges count (a name still rising today peaks in the last year)
+    padded = np.pad(values, ((0, 0), (1, 1)), mode="constant", constant_values=-np.inf)
+    is_peak = (values > padded[:, :-2]) & (values >= padded[:, 2:])
+    rows, columns = np.nonzero(is_peak)
+
+    row_max = values.max(axis=1) if n_years > 0 else np.zeros(n_rows)
+    prominence = peak_prominences(values, rows, columns) / np.where(row_max > 0, row_max, 1)[rows]
+    keep = (prominence >= min_prominence) & (prominence > 0)
+    rows, columns, prominence = rows[keep], columns[keep], prominence[keep]
+
+    #most prominent first within each row
+    order = np.lexsort((-prominence, rows))
+    rows, columns, prominence = rows[order], columns[order], prominence[order]
+    n_peaks = np.bincount(rows, minlength=n_rows)
+    rank = np.arange(len(rows)) - np.repeat(np.cumsum(n_peaks) - n_peaks, n_peaks)
+
+    width = max(1, n_peaks.max() if n_rows > 0 else 1)
+    peak_years = np.full((n_rows, width), np.nan)
+    peak_prominence = np.full((n_rows, width), np.nan)
+    peak_years[rows, rank] = years[columns]
+    peak_prominence[rows, rank] = prominence
+
+    return {"n_peaks": n_peaks, "peak_years": peak_years, "prominence": peak_prominence}
+
+
+def em_steps(share, years, weight, mean, sigma, iterations, tol, min_sigma):
+    """EM iterations for a block of rows (share: rows x years, each row sums to 1,
+    the others rows x components; a component of weight 0 stays out). Rows which
+    have converged (log likelihood change below tol) leave the block.
+    Returns (weight, mean, sigma, loglik).
+    """
+    loglik = np.full(len(share), np.nan)
+    previous = np.full(len(share), -np.inf)
+    active = np.arange(len(share))
+    for iteration in range(iterations):
+        if len(active) == 0:
+            break
+        w, m, s, x = weight[active], mean[active], sigma[active], share[active]
+
+        #E step: responsibility of every component for every year, (rows x components x years),
+        #in logs: far from every component all the densities underflow to 0 (log-sum-exp)
+        z = (years - m[:, :, np.newaxis]) / s[:, :, np.newaxis]
+        with np.errstate(divide="ignore"):  #log(0) = -inf for a component of weight 0
+            log_density = np.log(w / (np.sqrt(2 * np.pi) * s))[:, :, np.newaxis] - 0.5 * z * z
+            top = log_density.max(axis=1)
+            top[~np.isfinite(top)] = 0
+            log_total = top + np.log(np.exp(log_density - top[:, np.newaxis, :]).sum(axis=1))
+        log_total[~np.isfinite(log_total)] = 0  #only rows without weight, x = 0 there
+        loglik[active] = (x * log_total).sum(axis=1)
+
+        #M step, all the active rows at once
+        mass = np.exp(log_density - log_total[:, np.newaxis, :]) * x[:, np.newaxis, :]
+        w = mass.sum(axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m = np.where(w > 0, (mass * years).sum(axis=2) / w, m)
+            variance = (mass * (years - m[:, :, np.newaxis]) ** 2).sum(axis=2) / w
+        weight[active], mean[active] = w, m
+        sigma[active] = np.maximum(np.sqrt(np.nan_to_num(variance)), min_sigma)
+
+        converged = np.abs(loglik[active] - previous[active]) < tol
+        previous[active] = loglik[active]
+        active = active[~converged]
+
+    return (weight, mean, sigma, loglik)
+
+
+def fit_mixture(weights, years, components=2, iterations=200, tol=1e-6, min_sigma=1.0,
+                start=None, chunk_size=4096):
+    """Fits a mixture of up to components Gaussians to every row of a (names x years)
+    weights matrix with EM on the weighted years (no expansion into one entry per person).
+    start is an optional (rows x components) array of starting means, e.g. the
+    "peak_years" of find_peaks_matrix: a row gets one component per peak given
+    (nan = no component, at least one), else components starting at the quantiles.
+    Returns a dict of (rows x components) arrays "weight", "mean", "sigma", sorted by
+    mean (nan for unused components), and "loglik": the average log likelihood per person.
+    """
+    years = np.asarray(years, dtype=float)
+    n_rows = len(weights)
+    result = dict((key, np.full((n_rows, components), np.nan)) for key in ("weight", "mean", "sigma"))
+    result["loglik"] = np.full(n_rows, np.nan)
+
+    for first in range(0, n_rows, chunk_size):
+        last = min(first + chunk_size, n_rows)
+        block = np.asarray(weights[first:last], dtype=float)
+        totals = block.sum(axis=1)
+        share = block / np.where(totals > 0, totals, 1)[:, np.newaxis]  #each row sums to 1
+
+        #start: the given means, or the quantiles (the median for rows without any given)
+        cumulative = np.cumsum(share, axis=1)
+        quantiles = (np.arange(components) + 0.5) / components
+        below = (cumulative[:, np.newaxis, :] < quantiles[np.newaxis, :, np.newaxis]).sum(axis=2)
+        mean = years[np.minimum(below, len(years) - 1)]
+        weight = np.ones(mean.shape)
+        if start is not None:
+            given = np.full(mean.shape, np.nan)
+            width = min(components, np.shape(start)[1])
+            given[:, :width] = np.asarray(start[first:last], dtype=float)[:, :width]
+            median = years[np.minimum((cumulative < 0.5).sum(axis=1), len(years) - 1)]
+            given[:, 0] = np.where(np.isnan(given[:, 0]), median, given[:, 0])
+            weight = (~np.isnan(given)).astype(float)
+            mean = np.where(np.isnan(given), 0, given)
+        weight /= weight.sum(axis=1)[:, np.newaxis]
+        used = weight > 0
+        spread = np.sqrt((share * (years - (share * years).sum(axis=1)[:, np.newaxis]) ** 2).sum(axis=1))
+        sigma = np.maximum(spread[:, np.newaxis] / used.sum(axis=1)[:, np.newaxis], min_sigma) * np.ones(mean.shape)
+
+        weight, mean, sigma, loglik = em_steps(share, years, weight, mean, sigma, iterations, tol, min_sigma)
+
+        mean[~used] = np.nan
+        order = np.argsort(mean, axis=1)  #nan last
+        block_rows = np.arange(len(block))[:, np.newaxis]
+        empty = ~(totals > 0)
+        for key, values in (("weight", weight), ("mean", mean), ("sigma", sigma)):
+            values = np.where(used, values, np.nan)[block_rows, order]
+            values[empty] = np.nan
+            result[key][first:last] = values
+        result["loglik"][first:last] = np.where(empty, np.nan, loglik)
+
+    return result
+
+
+def main():
+
+    threshold = 400000
+    if len(sys.argv) > 1:
+        threshold = int(sys.argv[1])
+
+    if not names_store.store_exists():
+        print "Compiling baby names store (only needed once) ..."
+        names_store.compile_names_store(range(1880, 2018))
+    store = names_store.load_names_store()
+    years = store["years"].tolist()
+    timer = stage_timer.StageTimer()
+
+    for sex in ("F", "M"):
+        rows = np.nonzero(store[sex]["totals"] > threshold)[0]
+        alive_prob = actuarial.alive_prob(sex, years, reference_year=max(years))
+        number_alive = np.asarray(store[sex]["counts"][rows]) * alive_prob
+
+        with timer.stage(sex + " peaks") as stage:
+            peaks = find_peaks_matrix(number_alive, years)
+            stage["items"] = len(rows)
+        multimodal = np.nonzero(peaks["n_peaks"] > 1)[0]
+        with timer.stage(sex + " mixture") as stage:
+            mixture = fit_mixture(number_alive[multimodal], years, start=peaks["peak_years"][multimodal])
+            stage["items"] = len(multimodal)
+
+        print
+        print "%s names above %d: %d, with more than one peak: %d" % (sex, threshold, len(rows), len(multimodal))
+        print "Name, peaks (born), mixture: share at mean +- sigma"
+        for i, row in enumerate(multimodal):
+            born = sorted(int(year) for year in peaks["peak_years"][row] if not np.isnan(year))
+            parts = ["%0.0f%% at %0.0f+-%0.0f" % (100 * weight, mean, sigma) for weight, mean, sigma
+                     in zip(mixture["weight"][i], mixture["mean"][i], mixture["sigma"][i])]
+            print "%s, %s, %s" % (store[sex]["names"][rows[row]], " & ".join(map(str, born)), ", ".join(parts))
+
+    print
+    print timer.summary()
+    print
+
+
+if __name__ == '__main__':
+  main()
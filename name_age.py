@@ -6,8 +6,10 @@
 import re
 import numpy as np
 import matplotlib.pyplot as plt
-import csv
-import scipy.stats as st
+import names_store
+import actuarial
+import weighted_stats
+import name_lookup
 
 
 def get_singlename_year(name, sex, year):
@@ -22,8 +24,9 @@ def get_singlename_year(name, sex, year):
     #open the file and search for that name and sex, extracting the number
     with open(filename) as f:
         text = f.read()
-        pat = name + "," + sex + ",(\d+)"
-        result = re.findall(pat, text) 
+        #anchor the name to the start of the line so "Ann" doesn't match "Joann"
+        pat = "^" + re.escape(name) + "," + sex + ",(\d+)"
+        result = re.findall(pat, text, re.MULTILINE)
 
     if result == []:
         number = 0     #set number to zero if name isn't on the list
@@ -43,6 +46,11 @@ def get_name_numbers(name, sex, years):
 
     Returns a list containing the number of babies for that name from that year
     """
+    if names_store.store_exists():
+        #one row of the memory-mapped store instead of reading every year file
+        store = names_store.load_names_store()
+        return names_store.get_name_counts(store, name, sex, years).tolist()
+
     data = []
     for year in years:
         number = get_singlename_year(name, sex, year)
@@ -56,56 +64,50 @@ def get_name_numbers(name, sex, years):
 
 
 
-def open_actuarial_data(sex, years):
+def open_actuarial_data(sex, years, reference_year=None):
     """ Opens the adjusted 2014 actuarial table.
     Imports only the data spanning the input years (list of integers)
     Imports only the probability to be alive in 2017 for sex ="M" or "F".
-    The actuarial file has years, M_dp, M_le, M_notdead, M_alive_prob, F_dp, ...
+    (or in reference_year, if given, e.g. after adding a newer year of SSA data)
+    The table is parsed once and shared, see actuarial.py
     """
-    filename = "adj_act_data_2014.txt"  #file generated using get_actdata_2014.py
-
-    all_data = []
-
-    with open(filename) as f:
-      text = csv.reader(f)   
-      for line in text:
-        all_data.append(line)
-
-    #I discovered the csv reader after I had already
-    #written the get_singlename_year() function
-    
-    alive_prob = []
-    shift = min(years) - 1880
-    for index, item in enumerate(years):
-      index +=shift
-      if sex == "M":
-        #Male alive prob. data is stored in column 4 of actuary file
-        alive_prob.append(float(all_data[index][4]))  
-      elif sex == "F":
-        #Female alive prob. data is stored in column 8 of actuary file
-        alive_prob.append(float(all_data[index][8]))
-      else:
+    if sex not in ("M", "F"):
         print "Neither F or M chosen"
         return False
 
+    #a read only view of the table, no copy
+    alive_prob = actuarial.alive_prob(sex, years, reference_year=reference_year)
 
     return alive_prob  #returns the probability of being alive in 2017
 
 
-def calc_number_alive(name, sex, years):
+def today():
+    """The year "today": the last year of the compiled store (e.g. 2018 once yob2018.txt
+    is appended), or None without a store (the last year of the actuarial table).
+    It never depends on the years asked for, which can stop earlier.
+    """
+    if names_store.store_exists():
+        return int(names_store.load_names_store()["years"][-1])
+    return None
+
+
+def calc_number_alive(name, sex, years, names_data=None, reference_year=None):
     """Given a name, sex and range of years,
     calls functions which extract the number of name instances throuught years
     and which extract the actuarial information.
+    If the baby numbers (names_data) were already looked up, they are reused.
+    reference_year is the year "today" (default 2017, see open_actuarial_data).
 
     Returns a list with the number expected to still be alive in 2017.
     Returned list is in same order as years.
     """
 
     #Get actuarial data for sex = "M" or "F"
-    alive_prob = open_actuarial_data(sex, years)
+    alive_prob = open_actuarial_data(sex, years, reference_year)
 
     #Get baby numbers for that name and sex
-    names_data = get_name_numbers(name, sex, years) #a list of numbers
+    if names_data is None:
+        names_data = get_name_numbers(name, sex, years) #a list of numbers
 
     number_alive = names_data[:] #initialize, mainly for length
 
@@ -115,28 +117,73 @@ def calc_number_alive(name, sex, years):
     return number_alive
   
 
-#Need to flip number_alive vs. years data into a histogram
-#in order to perform standard statistics with numpy an scipy
+def get_name_numbers_batch(pairs, years):
+    """Batch version of get_name_numbers() for a list of (name, sex) pairs.
+    Every year file is read only once for the whole batch
+    (or not at all when the compiled store exists).
 
+    Returns an array with one row per pair and one column per year
+    """
+    data = np.zeros((len(pairs), len(years)), dtype=np.int64)
 
-def analysis(number_alive, years):
+    if names_store.store_exists():
+        store = names_store.load_names_store()
+        for row, (name, sex) in enumerate(pairs):
+            data[row] = names_store.get_name_counts(store, name, sex, years)
+        return data
 
-    data = []  # convert number_alive vs years into a histogram for stats analysis
-    for index, value in enumerate(number_alive):
-        i = 0
-        while i < value:
-          data.append(years[index])
-          i+=1
+    rows_of = {}  #(name, sex) -> rows of data, a name can be asked for twice
+    for row, (name, sex) in enumerate(pairs):
+        rows_of.setdefault((name, sex), []).append(row)
 
-    mean = np.mean(data)
-    median = np.median(data)
-    stddev = np.std(data)
-    sk = st.skew(data)
-    kurt = st.kurtosis(data)
+    for index, year in enumerate(years):
+        filename = "names/yob" + str(year) + ".txt"
+        names, sexes, numbers = names_store.parse_year_file(filename)
+        for name, sex, number in zip(names, sexes, numbers):
+            rows = rows_of.get((name, sex))
+            if rows is not None:
+                data[rows, index] = number
 
-#    print st.describe(data)
-    
-    return (mean, median, stddev, sk, kurt) #a tuple
+    return data
+
+
+def calc_number_alive_batch(pairs, years):
+    """Batch version of calc_number_alive() + analysis() for a list of (name, sex) pairs.
+    The actuarial data and the names data are loaded once for the whole batch.
+    "Today" is the last year of the store (see today()), whatever the years asked for.
+
+    Returns a tuple (number_alive, results) where number_alive is an array
+    with one row per pair (same order) and one column per year,
+    and results is a list with the (mean, median, stddev, sk, kurt) tuple of each pair.
+    """
+    alive_prob = {}
+    for name, sex in pairs:
+        if sex not in alive_prob:
+            if sex not in ("M", "F"):
+                raise ValueError("sex must be M or F, not %r (name %s)" % (sex, name))
+            #Get actuarial data for sex = "M" or "F"
+            alive_prob[sex] = open_actuarial_data(sex, years, reference_year=today())
+
+    names_data = get_name_numbers_batch(pairs, years)
+
+    number_alive = np.zeros(names_data.shape)
+    for row, (name, sex) in enumerate(pairs):
+        number_alive[row] = names_data[row] * alive_prob[sex]
+
+    stats = weighted_stats.weighted_stats_matrix(number_alive, years)
+    results = zip(*stats)
+
+    return (number_alive, results)
+  
+
+#Rather than flipping number_alive vs. years data into a histogram
+#(one entry per person), the statistics are calculated directly
+#from the weights in weighted_stats.py
+
+
+def analysis(number_alive, years):
+
+    return weighted_stats.weighted_stats(number_alive, years) #a tuple
     
       
   
@@ -153,9 +200,28 @@ def main():
 
 
     years = range(1880,2018)  #let's look at all the available data
+    if names_store.store_exists():
+        #every year in the store, including years appended since
+        years = names_store.load_names_store()["years"].tolist()
+
+        #fix up the capitalisation, or suggest names instead of returning all zeros
+        sex = sex.strip().upper()
+        lookup = name_lookup.load_name_lookup()
+        store_name = lookup.resolve(name.strip(), sex)
+        if store_name is None:
+            print "There are no SSA records for %s, %s." % (name, sex)
+            suggestions = lookup.suggest(name.strip(), sex, limit=5)
+            if suggestions:
+                print "Did you mean: %s?" % ", ".join(suggestion[0] for suggestion in suggestions)
+            print
+            return None
+        if store_name != name:
+            print "Using the SSA spelling %s." % store_name
+            name = store_name
 
+    names_data = get_name_numbers(name, sex, years) #a list of numbers
     
-    number_alive = calc_number_alive(name, sex, years)
+    number_alive = calc_number_alive(name, sex, years, names_data, reference_year=today())
 
     result = analysis(number_alive,years)
     av_age = max(years) - result[0]
@@ -165,7 +231,14 @@ def main():
     print
     print "The average age for %s, %s is %0.1f." %(name, sex, av_age)
     print "The median age for %s, %s is %0.1f." %(name, sex, med_age)
-    print "The std dev is %0.1f,  skewness is %0.3f, and kurtosis is %0.3f.\n\n" %(result[2], result[3], result[4])
+    print "The std dev is %0.1f,  skewness is %0.3f, and kurtosis is %0.3f." %(result[2], result[3], result[4])
+    for mass in (0.5, 0.9):
+        first, last = weighted_stats.highest_density_interval(number_alive, years, mass)
+        if np.isnan(first):
+            break  #nobody alive, no range to give
+        print "%d%% of them are %d to %d years old (born %d-%d)." %(100 * mass, max(years) - last,
+                                                                    max(years) - first, first, last)
+    print "\n"
 
     # Plotting
     plt.rcParams['figure.figsize'] = [7,4]
@@ -178,9 +251,6 @@ def main():
     plt.rcParams['xtick.direction'] = "in"
 
 
-    names_data = get_name_numbers(name, sex, years) #a list of numbers
-
-
     plt.plot(years, number_alive ,label="Number likely to be alive", color="blue")
     plt.plot(years, names_data,label="Total number born", color="red")
     plt.axvline(x=result[0], label="mean", color = "black")
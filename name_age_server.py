@@ -0,0 +1,262 @@
+#Local query server for name -> age estimates
+#name_age.py pays for the interpreter start up, the imports and loading
+#all the data before it answers a single question. This program loads the
+#compiled names store and the actuarial table once and then answers
+#questions over HTTP on the loopback interface:
+#  GET /age?name=Jennifer&sex=F  -> mean/median year and age, std, skew, kurtosis and the
+#                                   shortest ranges of birth years holding 50% and 90% (JSON,
+#                                   null for the statistics of a name with nobody alive)
+#  GET /suggest?name=jen&sex=F   -> completions and near matches of a name (JSON)
+#  GET /stats                    -> number of requests, throughput, latency and cache counters (JSON)
+#Names are looked up case insensitively (name_lookup.py), and an unknown name gets suggestions.
+#Results are kept in a ResultCache (result_cache.py), so popular names are only computed once.
+#Every request is handled in its own thread, so several clients can ask at once.
+#Start with "python name_age_server.py [port]", query with query_name_age().
+
+import sys
+import time
+import json
+import threading
+import collections
+import urllib
+import urllib2
+import urlparse
+import BaseHTTPServer
+import SocketServer
+import numpy as np
+import names_store
+import weighted_stats
+import actuarial
+import result_cache
+import name_lookup
+
+
+HOST = "127.0.0.1"  #loopback only
+PORT = 8017
+
+
+class QueryStats(object):
+    """Thread safe counters for the /stats endpoint"""
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=window)  #most recent latencies in seconds
+
+    def record(self, latency, error=False):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            self.latencies.append(latency)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            requests = self.requests
+            errors = self.errors
+        uptime = time.time() - self.start_time
+
+        summary = {"requests": requests, "errors": errors, "uptime_s": uptime,
+                   "throughput_per_s": requests / uptime}
+        if len(latencies) > 0:
+            summary["latency_ms"] = {"mean": 1000 * latencies.mean(),
+                                     "p50": 1000 * np.percentile(latencies, 50),
+                                     "p99": 1000 * np.percentile(latencies, 99),
+                                     "max": 1000 * latencies.max()}
+        return summary
+
+
+class NameAgeData(object):
+    """Names counts and actuarial data, loaded when the server starts and
+    again whenever the files change (the cache sees it, see result_cache.py).
+    years defaults to every year in the store (including years appended since).
+    "Today" is the last year of the store, even when years stop earlier:
+    the probability to be alive and the ages are for that year.
+    """
+
+    def __init__(self, years=None, cache_bytes=16 * 1024 * 1024):
+        if not names_store.store_exists():
+            print "Compiling baby names store (only needed once) ..."
+            names_store.compile_names_store(range(1880, 2018))
+
+        self.store_years = years is None  #follow the years of the store
+        self.years = None if years is None else list(years)
+        self.load()
+        self.cache = result_cache.ResultCache(max_bytes=cache_bytes, on_invalidate=self.reload)
+
+    def load(self, reload=False):
+        store = names_store.load_names_store(reload=reload)
+        years = store["years"].tolist() if self.store_years else self.years
+        today = int(store["years"][-1])
+        alive_prob = dict((sex, actuarial.alive_prob(sex, years, reference_year=today))
+                          for sex in ("F", "M"))
+        #requests in flight see either the old or the new data, not a mix
+        self.store, self.years, self.today, self.alive_prob = store, years, today, alive_prob
+        lookup = name_lookup.load_name_lookup()
+        lookup.deletion_index()  #loaded (or built) here, not in the first misspelled request
+        self.lookup = lookup
+
+    def reload(self):
+        """Reads the store and the actuarial table again (they changed on disk)"""
+        self.load(reload=True)
+
+    def estimate(self, name, sex):
+        """Returns a dict with the age estimate for name and sex,
+        or None if the name is not in the SSA data
+        """
+        store_name = self.lookup.resolve(name, sex)
+        if store_name is None:
+            return None
+        return self.cache.get_or_compute(store_name, sex, self.years, self.compute_estimate)
+
+    def suggest(self, name, sex=None, limit=10):
+        """Returns a dict with the completions and near matches of name"""
+        return {"name": name,
+                "prefix": [dict(zip(("name", "sex", "total_born"), match))
+                           for match in self.lookup.prefix(name, sex, limit)],
+                "fuzzy": [dict(zip(("name", "sex", "total_born", "distance"), match))
+                          for match in self.lookup.fuzzy(name, sex=sex, limit=limit)]}
+
+    def compute_estimate(self, name, sex, years):
+        store, years, today, alive_prob = self.store, self.years, self.today, self.alive_prob
+        names_data = names_store.get_name_counts(store, name, sex, years)
+        total = int(names_data.sum())
+        if total == 0:
+            return None
+
+        number_alive = names_data * alive_prob[sex]
+        mean, median, stddev, sk, kurt = weighted_stats.weighted_stats(number_alive, years)
+
+        return {"name": name, "sex": sex,
+                "mean_year": mean, "median_year": median,
+                "mean_age": today - mean, "median_age": today - median,
+                "stddev": stddev, "skewness": sk, "kurtosis": kurt,
+                "total_born": total, "number_alive": float(number_alive.sum()),
+                "born_50": list(weighted_stats.highest_density_interval(number_alive, years, 0.5)),
+                "born_90": list(weighted_stats.highest_density_interval(number_alive, years, 0.9))}
+
+
+def json_safe(value):
+    """Returns value (dicts and lists of numbers) with nan and infinity replaced by None.
+    json.dumps would write them as NaN and Infinity, which are not JSON, so clients
+    get null instead (e.g. the statistics of a name with nobody alive).
+    """
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return dict((key, json_safe(item)) for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+
+    return value
+
+
+class NameAgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        start = time.time()
+        url = urlparse.urlparse(self.path)
+
+        if url.path == "/age":
+            query = urlparse.parse_qs(url.query)
+            name = query.get("name", [""])[0]
+            sex = query.get("sex", [""])[0]
+            if name == "" or sex not in ("M", "F"):
+                status, body = 400, {"error": "usage: /age?name=NAME&sex=M or F"}
+            else:
+                result = self.server.data.estimate(name, sex)
+                if result is None:
+                    suggestions = self.server.data.lookup.suggest(name, sex, limit=5)
+                    status, body = 404, {"error": "no SSA records for %s, %s" % (name, sex),
+                                         "suggestions": [suggestion[0] for suggestion in suggestions]}
+                else:
+                    status, body = 200, result
+        elif url.path == "/suggest":
+            query = urlparse.parse_qs(url.query)
+            name = query.get("name", [""])[0]
+            sex = query.get("sex", [None])[0]
+            if name == "" or sex not in (None, "M", "F"):
+                status, body = 400, {"error": "usage: /suggest?name=NAME[&sex=M or F]"}
+            else:
+                status, body = 200, self.server.data.suggest(name, sex)
+        elif url.path == "/stats":
+            body = self.server.stats.summary()
+            body["cache"] = self.server.data.cache.info()
+            status = 200
+        else:
+            status, body = 404, {"error": "unknown path %s" % url.path}
+
+        self.send_json(status, body)
+        if url.path != "/stats":
+            self.server.stats.record(time.time() - start, error=(status != 200))
+
+    def send_json(self, status, body):
+        text = json.dumps(json_safe(body), allow_nan=False)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        pass  #keep the terminal quiet, see /stats instead
+
+
+class NameAgeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data):
+        BaseHTTPServer.HTTPServer.__init__(self, address, NameAgeHandler)
+        self.data = data
+        self.stats = QueryStats()
+
+
+def make_server(years=None, host=HOST, port=PORT):
+    """Loads the data and returns the (not yet running) server.
+    years defaults to every year in the store.
+    Use port=0 to pick any free port (see server.server_address).
+    """
+    return NameAgeServer((host, port), NameAgeData(years))
+
+
+def query_name_age(name, sex, host=HOST, port=PORT):
+    """Client: asks the server for the age estimate of name, sex.
+    Returns the decoded JSON dict (with an "error" key if the server refused)
+    """
+    url = "http://%s:%d/age?%s" % (host, port, urllib.urlencode({"name": name, "sex": sex}))
+    try:
+        response = urllib2.urlopen(url)
+    except urllib2.HTTPError as error:
+        response = error
+
+    return json.loads(response.read())
+
+
+def query_server_stats(host=HOST, port=PORT):
+    """Client: returns the server /stats dict"""
+    return json.loads(urllib2.urlopen("http://%s:%d/stats" % (host, port)).read())
+
+
+def main():
+
+    port = PORT
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+
+    print
+    print "Loading names and actuarial data ..."
+    server = make_server(port=port)
+    print "Listening on http://%s:%d/age?name=NAME&sex=F" % server.server_address
+    print
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,257 @@
+#Prefix and fuzzy lookup of the names in the compiled store
+#The SSA names are case sensitive ("Jennifer", not "jennifer") and a misspelled name
+#silently gets zero babies in every year. A NameLookup, built from the name tables
+#of the store, fixes up the input before the analysis runs:
+#  find("jennifer")      - the exact, case insensitive matches
+#  prefix("jen")         - autocomplete: names starting with "jen", most popular first
+#  fuzzy("jenifer")      - names within a small edit (Levenshtein) distance, closest first
+#  resolve("jennifer", "F") - the store spelling of a name, or None
+#Prefixes are found by bisection in the sorted lower case names.
+#Near matches use a deletion index (as in SymSpell): two words within distance k
+#always share a string obtained by deleting at most k letters from each, so the
+#query only has to look up its own ~k*len deletions instead of comparing with every
+#name, and only the few candidates found are checked with the real edit distance.
+#The deletions of every name (a few seconds to compute) are hashed and saved in
+#names_store/lookup_index.npz by "python names_store.py" after compiling the store or
+#appending a year (see build_lookup_index), or else by the first fuzzy search; the server
+#loads it when it starts, so no query has to wait for them. With the index, a fuzzy
+#query on ~95k names takes about 0.5 ms (up to 2 ms for long names), a prefix 0.01 ms.
+
+import os
+import bisect
+import zlib
+import threading
+import numpy as np
+import names_store
+
+
+MAX_DISTANCE = 2  #largest edit distance the deletion index can answer
+
+
+def deletions(word, k):
+    """Returns the set of strings made by deleting up to k letters from word (including word)"""
+    result = set([word])
+    frontier = [word]
+    for i in range(k):
+        new = []
+        for part in frontier:
+            for position in range(len(part)):
+                shorter = part[:position] + part[position + 1:]
+                if shorter not in result:
+                    result.add(shorter)
+                    new.append(shorter)
+        frontier = new
+
+    return result
+
+
+def string_hash(text):
+    return zlib.crc32(text) & 0xffffffff
+
+
+def edit_distances(word, codes, lengths):
+    """Levenshtein distances between word and many words at once.
+    codes is the uint8 matrix of the other words (one per row, zero padded)
+    and lengths their lengths. The rows of the dynamic programming table are
+    computed for all the words together; within a row the insertions are a running
+    minimum: d[j] = min over t <= j of (base[t] + j - t).
+    """
+    n, width = codes.shape
+    columns = np.arange(width + 1)
+    previous = np.tile(columns, (n, 1))
+    for i, char in enumerate(np.fromstring(word, dtype=np.uint8), 1):
+        base = np.empty_like(previous)
+        base[:, 0] = i
+        base[:, 1:] = np.minimum(previous[:, 1:] + 1, previous[:, :-1] + (codes != char))
+        previous = np.minimum.accumulate(base - columns, axis=1) + columns
+
+    return previous[np.arange(n), lengths]
+
+
+def build_deletion_index(keys, max_distance=MAX_DISTANCE):
+    """Returns (hashes, key_ids): the sorted hashes of the deletions of every key
+    and the position in keys of the key each one comes from
+    """
+    hashes = []
+    key_ids = []
+    for key_id, key in enumerate(keys):
+        parts = deletions(key, max_distance)
+        hashes.extend(string_hash(part) for part in parts)
+        key_ids.extend([key_id] * len(parts))
+
+    hashes = np.array(hashes, dtype=np.uint32)
+    key_ids = np.array(key_ids, dtype=np.int32)
+    order = np.argsort(hashes, kind="mergesort")
+
+    return (hashes[order], key_ids[order])
+
+
+class NameLookup(object):
+    """Case insensitive exact, prefix and fuzzy lookup of the names of a store"""
+
+    def __init__(self, store, store_dir=names_store.STORE_DIR):
+        self.store_dir = store_dir
+        self.n_names = dict((sex, len(store[sex]["names"])) for sex in ("F", "M"))
+
+        #one entry per (name, sex) of the store
+        self.names = store["F"]["names"] + store["M"]["names"]
+        self.sexes = np.array(["F"] * self.n_names["F"] + ["M"] * self.n_names["M"])
+        self.totals = np.concatenate((store["F"]["totals"], store["M"]["totals"]))
+
+        #entries sorted by lower case name, for bisection
+        lower = [name.lower() for name in self.names]
+        self.order = np.array(sorted(range(len(lower)), key=lower.__getitem__), dtype=np.int64)
+        self.sorted_keys = [lower[entry] for entry in self.order]
+
+        #the distinct lower case names (keys), the entries of key i are
+        #sorted_keys[key_start[i]:key_start[i + 1]]
+        starts = [i for i, key in enumerate(self.sorted_keys) if i == 0 or key != self.sorted_keys[i - 1]]
+        self.keys = [self.sorted_keys[i] for i in starts]
+        self.key_start = np.array(starts + [len(self.sorted_keys)], dtype=np.int64)
+        self.key_lengths = np.array([len(key) for key in self.keys], dtype=np.int64)
+        self.key_codes = np.array(self.keys).view(np.uint8).reshape(len(self.keys), -1)
+
+        self._deletion_index = None  #built or loaded on the first fuzzy search
+
+    def entries(self, first, last, sex=None, limit=None):
+        """Returns the (name, sex, total) of the entries sorted_keys[first:last]
+        of the given sex (default both), most popular first, at most limit of them
+        """
+        entries = self.order[first:last]
+        if sex is not None:
+            entries = entries[self.sexes[entries] == sex]
+        totals = self.totals[entries]
+        if limit is not None and len(entries) > limit:
+            top = np.argpartition(-totals, limit - 1)[:limit]
+            entries, totals = entries[top], totals[top]
+        ranked = entries[np.lexsort((entries, -totals))]
+
+        return [(self.names[entry], str(self.sexes[entry]), int(self.totals[entry])) for entry in ranked]
+
+    def find(self, name, sex=None):
+        """Exact case insensitive matches of name, most popular first"""
+        key = name.lower()
+        first = bisect.bisect_left(self.sorted_keys, key)
+        last = bisect.bisect_right(self.sorted_keys, key)
+
+        return self.entries(first, last, sex)
+
+    def prefix(self, text, sex=None, limit=10):
+        """The limit most popular names starting with text (case insensitive)"""
+        key = text.lower()
+        first = bisect.bisect_left(self.sorted_keys, key)
+        last = bisect.bisect_left(self.sorted_keys, key + "\xff")
+
+        return self.entries(first, last, sex, limit)
+
+    def fuzzy(self, name, max_distance=MAX_DISTANCE, sex=None, limit=10):
+        """Names within max_distance edits of name (case insensitive, at most MAX_DISTANCE).
+        Returns a list of (name, sex, total, distance), closest then most popular first.
+        """
+        if max_distance > MAX_DISTANCE:
+            raise ValueError("the index only answers distances up to %d" % MAX_DISTANCE)
+        hashes, key_ids = self.deletion_index()
+
+        key = name.lower()
+        queries = np.array([string_hash(part) for part in deletions(key, max_distance)], dtype=np.uint32)
+        first = np.searchsorted(hashes, queries, side="left")
+        last = np.searchsorted(hashes, queries, side="right")
+        candidates = np.unique(np.concatenate([key_ids[start:stop] for start, stop in zip(first, last)]))
+
+        #check the candidates (hash matches) with the real edit distance
+        candidates = candidates[np.abs(self.key_lengths[candidates] - len(key)) <= max_distance]
+        distances = edit_distances(key, self.key_codes[candidates], self.key_lengths[candidates])
+        matches = candidates[distances <= max_distance]
+        distances = distances[distances <= max_distance]
+
+        #every (name, sex) entry of the matching keys
+        starts = self.key_start[matches]
+        lengths = self.key_start[matches + 1] - starts
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entries = self.order[positions + np.repeat(starts, lengths)]
+        distances = np.repeat(distances, lengths)
+        if sex is not None:
+            keep = self.sexes[entries] == sex
+            entries, distances = entries[keep], distances[keep]
+
+        ranked = np.lexsort((entries, -self.totals[entries], distances))[:limit]
+        return [(self.names[entries[i]], str(self.sexes[entries[i]]), int(self.totals[entries[i]]), int(distances[i]))
+                for i in ranked]
+
+    def resolve(self, name, sex):
+        """Returns the store spelling of name for sex: name itself if it is in the store,
+        else the most popular case insensitive match, else None
+        """
+        matches = self.find(name, sex)
+        for match in matches:
+            if match[0] == name:
+                return name
+
+        return matches[0][0] if matches else None
+
+    def suggest(self, name, sex=None, limit=10):
+        """Near matches and completions of name, for "did you mean" messages"""
+        suggestions = [result[:3] for result in self.fuzzy(name, sex=sex, limit=limit)]
+        for result in self.prefix(name, sex, limit):
+            if result not in suggestions:
+                suggestions.append(result)
+
+        return suggestions[:limit]
+
+    def deletion_index(self, rebuild=False):
+        """Loads the saved deletion index, or builds and saves it
+        (always with rebuild=True, e.g. when the store has just been compiled)
+        """
+        with _index_lock:  #server threads share the lookup: build it once, not once per thread
+            if self._deletion_index is None and not rebuild:
+                self._deletion_index = load_deletion_index(self.n_names, self.store_dir)
+            if self._deletion_index is None or rebuild:
+                self._deletion_index = build_deletion_index(self.keys)
+                save_deletion_index(self._deletion_index, self.n_names, self.store_dir)
+
+        return self._deletion_index
+
+
+def save_deletion_index(index, n_names, store_dir=names_store.STORE_DIR):
+    filename = os.path.join(store_dir, "lookup_index.npz")
+    temp_filename = "%s.%d.tmp.npz" % (filename, os.getpid())  #processes never share a temporary file
+    np.savez(temp_filename, hashes=index[0], key_ids=index[1], max_distance=MAX_DISTANCE,
+             n_names_F=n_names["F"], n_names_M=n_names["M"])
+    os.rename(temp_filename, filename)
+
+
+def load_deletion_index(n_names, store_dir=names_store.STORE_DIR):
+    """Returns the saved (hashes, key_ids), or None if there is none or it is out of date
+    (the name tables only grow, so the number of names tells if it is current)
+    """
+    filename = os.path.join(store_dir, "lookup_index.npz")
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename) as data:
+        if (int(data["max_distance"]) != MAX_DISTANCE or int(data["n_names_F"]) != n_names["F"]
+                or int(data["n_names_M"]) != n_names["M"]):
+            return None
+        return (data["hashes"], data["key_ids"])
+
+
+_lookups = {}  #store directory -> NameLookup, built once per process
+_index_lock = threading.Lock()  #one deletion index build at a time in a process
+
+
+def load_name_lookup(store_dir=names_store.STORE_DIR):
+    """Returns the NameLookup of the compiled store (built once per process)"""
+    store = names_store.load_names_store(store_dir)
+    lookup = _lookups.get(store_dir)
+    if lookup is None or lookup.n_names != dict((sex, len(store[sex]["names"])) for sex in ("F", "M")):
+        lookup = NameLookup(store, store_dir)
+        _lookups[store_dir] = lookup
+
+    return lookup
+
+
+def build_lookup_index(store_dir=names_store.STORE_DIR):
+    """Builds and saves the deletion index of the store in store_dir.
+    names_store.py main() runs this after compiling the store or appending a year.
+    """
+    _lookups.pop(store_dir, None)  #the name tables have changed
+    load_name_lookup(store_dir).deletion_index(rebuild=True)
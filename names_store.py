@@ -0,0 +1,422 @@
+#Compiled store for the SSA baby names data
+#Reading the 138 yobYYYY.txt files as text takes several seconds,
+#so this program compiles them once into a binary columnar store:
+#  names_store/years.npy      - the years covered (int32)
+#  names_store/names_F.txt    - the name table, one name per line (line number = name ID)
+#  names_store/counts_F.npy   - int32 matrix, row = name ID, column = year - first year
+#  names_store/totals_F.npy   - all time number of babies for each name ID (int64)
+#(and the same for M), plus names_store/name_index.pkl which maps
+#(name, sex) -> name ID so a single name is found in one dict lookup,
+#and names_store/lookup_index.npz, the fuzzy search index of name_lookup.py
+#(built by main() as a separate step after the store, see build_lookup_index).
+#demographics.py and name_age.py load it memory-mapped,
+#so start up is fast and the pages are shared between processes.
+#Run "python names_store.py" after unzipping names.zip to build the store.
+#When SSA publishes a new year, "python names_store.py append" adds just that
+#year's file to the store (see append_year) instead of rebuilding everything.
+
+import os
+import sys
+import time
+import itertools
+import multiprocessing
+import cPickle
+import numpy as np
+
+
+STORE_DIR = "names_store"  #default location of the compiled store
+NAMES_DIR = "names"        #default location of the SSA text files
+CHUNK_YEARS = 10           #most year files parsed together, see read_year_entries
+
+_loaded_stores = {}  #stores already loaded by this process, keyed by directory
+
+
+def parse_year_file(filename):
+    """Given the filename of a SSA baby names file (e.g. names/yob1999.txt),
+    returns a tuple of three columns (names, sexes, counts) in file order:
+    names and sexes are lists of strings, counts an int64 array.
+    The whole file is split on commas and line breaks in one pass (no regex),
+    so hyphenated and non-ASCII names are kept exactly as they are written.
+    """
+    with open(filename, "rb") as f:
+        text = f.read()
+
+    #"name,sex,count" lines -> one flat list of fields
+    fields = text.replace("\r", "").strip().replace("\n", ",").split(",")
+    if fields == [""]:
+        return ([], [], np.zeros(0, dtype=np.int64))
+    if len(fields) % 3 != 0:
+        raise ValueError("%s is not in the name,sex,count format" % filename)
+
+    names = fields[0::3]
+    sexes = fields[1::3]
+    counts = np.fromstring(" ".join(fields[2::3]), dtype=np.int64, sep=" ")  #C parser, not astype
+    if len(counts) != len(names):
+        raise ValueError("%s has a count which is not a number" % filename)
+
+    return (names, sexes, counts)
+
+
+def pool_processes(processes):
+    """Number of worker processes for processes (None = one per core)"""
+    if processes is None:
+        return multiprocessing.cpu_count()
+    return processes
+
+
+def parse_year_chunk(args):
+    """Pool task: parses the year files of a chunk of years and numbers the names
+    of the chunk, so only arrays go back to the parent (no lists of strings).
+    args is (filenames, year_index): the files and their positions in the years.
+    Returns (lines, {"F": entries, "M": entries}), where entries is a tuple
+    (names, ids, year_index, counts): the distinct names of the chunk (sorted) and,
+    for every line of that sex in file order, the position of its name in names,
+    its year position and its number of babies.
+    """
+    filenames, year_index = args
+    lines = 0
+    columns = {"F": ([], [], []), "M": ([], [], [])}
+    for filename, index in zip(filenames, year_index):
+        names, sexes, counts = parse_year_file(filename)
+        lines += len(names)
+        names = np.array(names, dtype=str)
+        sexes = np.array(sexes, dtype=str)
+        for sex in ("F", "M"):
+            mask = sexes == sex
+            columns[sex][0].append(names[mask])
+            columns[sex][1].append(np.full(mask.sum(), index, dtype=np.int32))
+            columns[sex][2].append(counts[mask].astype(np.int32))
+
+    entries = {}
+    for sex in ("F", "M"):
+        names = np.concatenate(columns[sex][0] or [np.zeros(0, dtype=str)])
+        unique_names, ids = np.unique(names, return_inverse=True)
+        entries[sex] = (unique_names, ids.astype(np.int32),
+                        np.concatenate(columns[sex][1] or [np.zeros(0, dtype=np.int32)]),
+                        np.concatenate(columns[sex][2] or [np.zeros(0, dtype=np.int32)]))
+
+    return (lines, entries)
+
+
+def merge_year_chunks(chunks):
+    """Merges the parse_year_chunk() results of consecutive chunks of years
+    (any iterable, consumed one chunk at a time so only one is held in memory).
+    Name IDs are given in order of first appearance (year, then line of the file).
+    Returns (lines, {"F": entries, "M": entries}), where entries is a tuple
+    (names, indptr, year_index, counts): the name table (list, position = name ID) and
+    the year position and number of babies of every line of that sex, sorted by name ID
+    (then year), so the lines of name ID i are indptr[i]:indptr[i+1].
+    """
+    lines = 0
+    table = {"F": [], "M": []}
+    known = {"F": (np.zeros(0, dtype=str), np.zeros(0, dtype=np.int32)),  #sorted names seen so far, their IDs
+             "M": (np.zeros(0, dtype=str), np.zeros(0, dtype=np.int32))}
+    parts = {"F": [], "M": []}  #name IDs, years and counts of the lines of each chunk
+    for chunk_lines, entries in chunks:
+        lines += chunk_lines
+        for sex in ("F", "M"):
+            chunk_names, chunk_ids, year_index, counts = entries[sex]
+            known_names, known_ids = known[sex]
+
+            #names already in the table keep their ID
+            position = np.searchsorted(known_names, chunk_names)
+            found = position < len(known_names)
+            found[found] = known_names[position[found]] == chunk_names[found]
+            id_of_name = np.empty(len(chunk_names), dtype=np.int32)
+            id_of_name[found] = known_ids[position[found]]
+
+            #the others are numbered in order of their first line in the chunk
+            first_line = np.unique(chunk_ids, return_index=True)[1]
+            new = np.flatnonzero(~found)
+            new = new[np.argsort(first_line[new], kind="mergesort")]
+            id_of_name[new] = np.arange(len(table[sex]), len(table[sex]) + len(new), dtype=np.int32)
+            table[sex].extend(chunk_names[new].tolist())
+
+            known_names = np.concatenate((known_names, chunk_names[new]))
+            known_ids = np.concatenate((known_ids, id_of_name[new]))
+            order = np.argsort(known_names, kind="mergesort")
+            known[sex] = (known_names[order], known_ids[order])
+
+            #the lines are in year order, so a (year, number of lines) pair per year will do
+            parts[sex].append((id_of_name[chunk_ids], np.unique(year_index, return_counts=True), counts))
+
+    merged = {}
+    for sex in ("F", "M"):
+        n_names = len(table[sex])
+        lines_per_name = np.zeros(n_names, dtype=np.int64)
+        for part in parts[sex]:
+            lines_per_name += np.bincount(part[0], minlength=n_names)
+        indptr = np.concatenate(([0], np.cumsum(lines_per_name)))
+
+        #each chunk's lines go straight to their place, so the lines are never all
+        #joined in file order and sorted afterwards (which needs twice the memory)
+        sorted_year_index = np.empty(indptr[-1], dtype=np.int32)
+        sorted_counts = np.empty(indptr[-1], dtype=np.int32)
+        next_line = indptr[:-1].copy()  #where the next line of each name goes
+        sex_parts = parts.pop(sex)
+        while sex_parts:
+            ids, year_lines, counts = sex_parts.pop(0)  #freed once it is placed
+            year_index = np.repeat(*year_lines).astype(np.int32)
+            order = np.argsort(ids, kind="mergesort")  #stable, so years stay in order
+            ids = ids[order]
+            place = next_line[ids] + np.arange(len(ids)) - np.searchsorted(ids, ids)
+            sorted_year_index[place] = year_index[order]
+            sorted_counts[place] = counts[order]
+            next_line += np.bincount(ids, minlength=n_names)
+
+        merged[sex] = (table[sex], indptr, sorted_year_index, sorted_counts)
+
+    return (lines, merged)
+
+
+def read_year_entries(filenames, processes=1):
+    """Reads the year files (consecutive years, in order) and returns the merged
+    entries of merge_year_chunks(). The files are parsed a chunk of at most
+    CHUNK_YEARS years at a time, which keeps the string arrays small; with processes
+    other than 1 the chunks are parsed by a pool of worker processes (None = one per core).
+    The result does not depend on the number of processes.
+    """
+    processes = pool_processes(processes)
+    year_index = range(len(filenames))
+    n_chunks = max(4 * processes, -(-len(filenames) // CHUNK_YEARS))  #a few chunks per worker to balance the load
+    n_chunks = max(1, min(len(filenames), n_chunks))
+    bounds = [len(filenames) * i // n_chunks for i in range(n_chunks + 1)]
+    tasks = [(filenames[start:stop], year_index[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+    if processes == 1:
+        return merge_year_chunks(itertools.imap(parse_year_chunk, tasks))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return merge_year_chunks(pool.imap(parse_year_chunk, tasks))  #in order, merged as they arrive
+    finally:
+        pool.close()
+        pool.join()
+
+
+def save_array(filename, array):
+    """np.save to a temporary file which then replaces filename,
+    so processes which have the old file memory-mapped keep a valid copy
+    """
+    temp_filename = filename + ".tmp.npy"
+    np.save(temp_filename, array)
+    os.rename(temp_filename, filename)
+
+
+def save_lines(filename, lines, append=False):
+    """Writes one line per item of lines (the name tables)"""
+    with open(filename, "a" if append else "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def save_name_index(store_dir, name_index):
+    temp_filename = os.path.join(store_dir, "name_index.pkl.tmp")
+    with open(temp_filename, "wb") as f:
+        cPickle.dump(name_index, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(temp_filename, os.path.join(store_dir, "name_index.pkl"))
+
+
+def compile_names_store(years, names_dir=NAMES_DIR, store_dir=STORE_DIR, processes=None):
+    """Given a list of consecutive years (integers), reads every yobYYYY.txt file
+    in names_dir and writes the compiled store to store_dir.
+    The files are parsed in parallel (see read_year_entries) and merged in year order.
+    Name IDs are given in order of first appearance, so the store is
+    the same every time it is built from the same files, whatever the number of processes.
+    Returns a dict with the number of "lines" parsed and the "parse_time" in seconds.
+    """
+    years = list(years)
+
+    filenames = [os.path.join(names_dir, "yob" + str(year) + ".txt") for year in years]
+    start_time = time.time()
+    lines, entries = read_year_entries(filenames, processes)
+    parse_time = time.time() - start_time
+
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+
+    save_array(os.path.join(store_dir, "years.npy"), np.array(years, dtype=np.int32))
+
+    name_index = {}  #exact (name, sex) keys, so "Ann" can never match "Joann"
+    for sex in ("F", "M"):
+        names, indptr, year_index, numbers = entries[sex]
+        counts = np.zeros((len(names), len(years)), dtype=np.int32)
+        counts[np.repeat(np.arange(len(names)), np.diff(indptr)), year_index] = numbers
+
+        save_array(os.path.join(store_dir, "counts_" + sex + ".npy"), counts)
+        save_array(os.path.join(store_dir, "totals_" + sex + ".npy"), counts.sum(axis=1, dtype=np.int64))
+        save_lines(os.path.join(store_dir, "names_" + sex + ".txt"), names)
+        name_index.update(((name, sex), name_id) for name_id, name in enumerate(names))
+    save_name_index(store_dir, name_index)
+
+    _loaded_stores.pop(store_dir, None)  #the old copy is out of date
+    #the fuzzy search index of the old names (its names may differ even if their number does not)
+    lookup_index = os.path.join(store_dir, "lookup_index.npz")
+    if os.path.isfile(lookup_index):
+        os.remove(lookup_index)
+
+    return {"lines": lines, "parse_time": parse_time}
+
+
+def append_year(year, names_dir=NAMES_DIR, store_dir=STORE_DIR):
+    """Adds the yobYYYY.txt file of a new year (the year after the last one
+    in the store) to the compiled store, without reading the other years again.
+    Existing names keep their name IDs; names seen for the first time are
+    added at the end of the name table.
+    Returns a dict {"F": ids, "M": ids} with the name IDs whose counts changed,
+    i.e. the names which appear in the new year (and so need new stats).
+    """
+    store_years = np.load(os.path.join(store_dir, "years.npy"))
+    if year != store_years[-1] + 1:
+        raise ValueError("can only append %d to the store, not %d" % (store_years[-1] + 1, year))
+
+    with open(os.path.join(store_dir, "name_index.pkl"), "rb") as f:
+        name_index = cPickle.load(f)
+
+    filename = os.path.join(names_dir, "yob" + str(year) + ".txt")
+    year_names, year_sexes, year_counts = parse_year_file(filename)
+
+    changed = {}
+    for sex in ("F", "M"):
+        old_counts = np.load(os.path.join(store_dir, "counts_" + sex + ".npy"), mmap_mode="r")
+        n_old = old_counts.shape[0]
+
+        new_names = []
+        rows = []
+        numbers = []
+        for name, name_sex, number in zip(year_names, year_sexes, year_counts.tolist()):
+            if name_sex != sex:
+                continue
+            if (name, sex) not in name_index:
+                name_index[(name, sex)] = n_old + len(new_names)
+                new_names.append(name)
+            rows.append(name_index[(name, sex)])
+            numbers.append(number)
+
+        counts = np.zeros((n_old + len(new_names), len(store_years) + 1), dtype=np.int32)
+        counts[:n_old, :-1] = old_counts
+        counts[rows, -1] = numbers
+        del old_counts
+
+        save_array(os.path.join(store_dir, "counts_" + sex + ".npy"), counts)
+        save_array(os.path.join(store_dir, "totals_" + sex + ".npy"), counts.sum(axis=1, dtype=np.int64))
+        save_lines(os.path.join(store_dir, "names_" + sex + ".txt"), new_names, append=True)
+        changed[sex] = np.array(sorted(rows), dtype=np.int64)
+
+    save_name_index(store_dir, name_index)
+    save_array(os.path.join(store_dir, "years.npy"),
+               np.append(store_years, year).astype(np.int32))
+
+    _loaded_stores.pop(store_dir, None)  #the old copy is out of date
+
+    return changed
+
+
+def build_lookup_index(store_dir=STORE_DIR):
+    """Builds the name_lookup.py fuzzy search index of the store's names (a few seconds),
+    so the first misspelled name a server gets does not wait for it.
+    A separate step from compiling, which main() runs after the store is written.
+    """
+    import name_lookup  #name_lookup imports this module, so not at the top
+    start_time = time.time()
+    name_lookup.build_lookup_index(store_dir)
+    return time.time() - start_time
+
+
+def store_exists(store_dir=STORE_DIR):
+    """Returns True if a compiled store is found in store_dir"""
+    return os.path.isfile(os.path.join(store_dir, "years.npy"))
+
+
+def load_names_store(store_dir=STORE_DIR, reload=False):
+    """Loads the compiled store. The count matrices are memory-mapped (read only).
+    Returns a dict with the keys "years", "index", "F" and "M".
+    store["F"] is a dict with "names" (the name table), "counts" (the matrix)
+    and "totals" (all time number of babies for each name).
+    store["index"] maps (name, sex) to the row of the name in the matrix.
+    The store is only read from disk the first time it is loaded in a process
+    (or again with reload=True, e.g. after another process changed it).
+    """
+    if store_dir in _loaded_stores and not reload:
+        return _loaded_stores[store_dir]
+
+    store = {}
+    store["years"] = np.load(os.path.join(store_dir, "years.npy"))
+
+    for sex in ("F", "M"):
+        with open(os.path.join(store_dir, "names_" + sex + ".txt")) as f:
+            names = f.read().splitlines()
+        counts = np.load(os.path.join(store_dir, "counts_" + sex + ".npy"), mmap_mode="r")
+        totals_file = os.path.join(store_dir, "totals_" + sex + ".npy")
+        if os.path.isfile(totals_file):
+            totals = np.load(totals_file)
+        else:
+            totals = counts.sum(axis=1, dtype=np.int64)  #store compiled before the totals index
+        store[sex] = {"names": names, "counts": counts, "totals": totals}
+
+    with open(os.path.join(store_dir, "name_index.pkl"), "rb") as f:
+        store["index"] = cPickle.load(f)
+
+    _loaded_stores[store_dir] = store
+    return store
+
+
+def year_columns(store, years):
+    """Given the store and a list of consecutive years,
+    returns the slice of matrix columns spanning those years
+    """
+    first_year = int(store["years"][0])
+    last_year = int(store["years"][-1])
+    if min(years) < first_year or max(years) > last_year:
+        raise ValueError("years %d-%d are not in the compiled store (%d-%d)"
+                         % (min(years), max(years), first_year, last_year))
+
+    return slice(min(years) - first_year, max(years) - first_year + 1)
+
+
+def get_name_counts(store, name, sex, years):
+    """Given the store, a name, sex ("M" or "F") and a list of consecutive years,
+    returns an int32 array with the number of babies for each year.
+    The name must match exactly; an unknown name returns all zeros.
+    """
+    columns = year_columns(store, years)
+    name_id = store["index"].get((name, sex))
+    if name_id is None:
+        return np.zeros(columns.stop - columns.start, dtype=np.int32)
+
+    return np.array(store[sex]["counts"][name_id, columns])
+
+
+def main():
+
+    years = range(1880, 2018)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "append":
+        year = int(load_names_store()["years"][-1]) + 1
+        print
+        print "Adding %d to the compiled store ..." % year
+        changed = append_year(year)
+        print "Female names in %d: %d, Male names: %d" % (year, len(changed["F"]), len(changed["M"]))
+        print "Built the name lookup index in %0.2f s" % build_lookup_index()
+        print
+        return
+
+    print
+    print "Compiling baby names data from SSA files ... ... ..."
+    print
+
+    ingest = compile_names_store(years)
+    store = load_names_store()
+
+    print "Parsed %d lines in %0.2f s (%d lines/sec)" % (ingest["lines"], ingest["parse_time"],
+                                                        ingest["lines"] / max(ingest["parse_time"], 1e-9))
+
+    print "Total number of unique Female names: ", len(store["F"]["names"])
+    print "Total number of unique Male names: ", len(store["M"]["names"])
+    print "Built the name lookup index in %0.2f s" % build_lookup_index()
+    print
+    print "... store written to %s/" % STORE_DIR
+    print
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,200 @@
+#Cache of per-name results
+#Popular names are looked up again and again, and each lookup redoes
+#get_name_numbers -> calc_number_alive -> analysis. This cache keeps the
+#results keyed by (name, sex, first year, last year, data version):
+#  - least recently used entries are evicted once the cache is over max_bytes
+#  - the data version is built from the modification time and size of the
+#    actuarial file and of the names data (the source files of the compiled store,
+#    or the names/ files), so entries are dropped automatically when any of them
+#    change, and the owner of the cache is told to reload its data (on_invalidate)
+#  - hits, misses and evictions are counted (see info()) to help size the cache
+#  - optionally the cache is saved to / loaded from a file with save()
+
+import os
+import sys
+import time
+import hashlib
+import cPickle
+import threading
+import collections
+import numpy as np
+import names_store
+import actuarial
+
+
+#files of the compiled store the results are computed from; the files derived
+#from them (stats tables, lookup index, temporary files) are left out, so writing
+#those does not drop the cache
+STORE_FILES = ("years.npy", "counts_F.npy", "counts_M.npy", "names_F.txt", "names_M.txt", "name_index.pkl")
+
+
+def data_files():
+    """Returns the list of files the results depend on"""
+    files = [actuarial.ACTUARIAL_FILE]
+    if names_store.store_exists():
+        files += [os.path.join(names_store.STORE_DIR, f) for f in STORE_FILES]
+    elif os.path.isdir(names_store.NAMES_DIR):
+        names_dir = names_store.NAMES_DIR
+        files += [os.path.join(names_dir, f) for f in sorted(os.listdir(names_dir))]
+
+    return files
+
+
+def data_version(files=None):
+    """Returns a hash of the (filename, modification time, size) of the data files"""
+    if files is None:
+        files = data_files()
+
+    signature = []
+    for filename in files:
+        if os.path.exists(filename):
+            info = os.stat(filename)
+            signature.append((filename, info.st_mtime, info.st_size))
+        else:
+            signature.append((filename, None, None))
+
+    #md5 rather than hash() so a saved cache can be checked by another process
+    return hashlib.md5(repr(signature)).hexdigest()
+
+
+def size_of(value):
+    """Rough number of bytes used by a cached value (dicts, tuples, lists, arrays, numbers)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(key) + size_of(item) for key, item in value.iteritems())
+
+    return sys.getsizeof(value)
+
+
+class ResultCache(object):
+    """LRU cache of per-name results with a memory cap and data version invalidation"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, filename=None, check_interval=1.0, on_invalidate=None):
+        self.max_bytes = max_bytes
+        self.filename = filename              #where save() writes, None = memory only
+        self.check_interval = check_interval  #seconds between checks of the data files
+        self.on_invalidate = on_invalidate    #called (no arguments) when the data changed
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  #key -> (value, size), oldest first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.version = data_version()
+        self.last_check = time.time()
+        self.reloading = False  #on_invalidate is running
+
+        if filename is not None and os.path.isfile(filename):
+            self.load()
+
+    def check_version(self):
+        """Drops every entry if the actuarial file or the names data changed,
+        and calls on_invalidate so the data the results come from is reloaded too.
+        on_invalidate runs outside the lock (a reload takes a while, and the other
+        threads keep answering from the old data and entries until it is done).
+        """
+        with self.lock:
+            now = time.time()
+            if self.reloading or now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+
+            version = data_version()
+            if version == self.version:
+                return
+            self.reloading = True
+
+        try:
+            if self.on_invalidate is not None:
+                self.on_invalidate()
+        finally:
+            with self.lock:
+                self.version = version
+                self.entries.clear()
+                self.bytes = 0
+                self.invalidations += 1
+                self.reloading = False
+
+    def key(self, name, sex, years):
+        return (name, sex, min(years), max(years), self.version)
+
+    def get(self, name, sex, years):
+        """Returns the cached value, or None"""
+        self.check_version()
+        with self.lock:
+            key = self.key(name, sex, years)
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            value, size = self.entries.pop(key)
+            self.entries[key] = (value, size)  #now the most recently used
+            self.hits += 1
+            return value
+
+    def put(self, name, sex, years, value, version=None):
+        """Caches value. If version is given and the data changed since
+        (the value was computed from the old data), the value is not kept
+        """
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+            key = self.key(name, sex, years)
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+
+            size = size_of(value)
+            if size > self.max_bytes:
+                return  #would evict everything else
+            self.entries[key] = (value, size)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                old_key, (old_value, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def get_or_compute(self, name, sex, years, compute):
+        """Returns the cached value for name, sex and years,
+        or calls compute(name, sex, years), caches and returns its value
+        """
+        value = self.get(name, sex, years)
+        if value is None:
+            version = self.version
+            value = compute(name, sex, years)
+            self.put(name, sex, years, value, version)
+
+        return value
+
+    def info(self):
+        """Returns the cache counters as a dict"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    "hit_rate": float(self.hits) / lookups if lookups else 0.0}
+
+    def save(self):
+        """Writes the entries to self.filename"""
+        with self.lock:
+            with open(self.filename, "wb") as f:
+                cPickle.dump((self.version, self.entries), f, cPickle.HIGHEST_PROTOCOL)
+
+    def load(self):
+        """Reads the entries saved in self.filename, unless the data changed since"""
+        with open(self.filename, "rb") as f:
+            version, entries = cPickle.load(f)
+
+        with self.lock:
+            if version != self.version:
+                return  #saved for other data, start empty
+            self.entries = entries
+            self.bytes = sum(size for value, size in entries.itervalues())
+            while self.bytes > self.max_bytes:
+                old_key, (old_value, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
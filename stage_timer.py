@@ -0,0 +1,124 @@
+#Stage level instrumentation for the batch programs
+#A StageTimer records, for every stage of a run (read files, patch, analysis, ...):
+#  wall time, CPU time (user + system), peak resident memory (max RSS) and its growth,
+#  the traced Python memory peak when tracemalloc is available (not on Python 2),
+#  and the number of items (names, rows) processed per second if the stage says how many.
+#Any stage can also be run under cProfile. At the end of the run the timer prints a
+#human readable summary and saves the same figures as JSON, so batch runs can be
+#compared to spot regressions. Usage:
+#  timer = StageTimer(profile=["F analysis"])
+#  with timer.stage("F analysis") as stage:
+#      ...
+#      stage["items"] = number_of_names
+#  print timer.summary()
+#  timer.save("demographics_report.json")
+
+import os
+import sys
+import time
+import json
+import resource
+import contextlib
+import cProfile
+import pstats
+import StringIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  #Python 2: only the max RSS is measured
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far (ru_maxrss is in kB on Linux, bytes on Mac)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024.
+
+
+def cpu_time():
+    """User + system time of this process and of its finished worker processes"""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+class StageTimer(object):
+    """Records the time and memory of the stages of a run, see the header comment"""
+
+    def __init__(self, profile=(), profile_lines=15):
+        self.stages = []
+        self.profile = set(profile)  #names of the stages to run under cProfile
+        self.profile_lines = profile_lines
+        self.start_wall = time.time()
+        self.start_cpu = cpu_time()
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        """Times the with block as the stage name. The block can set
+        stage["items"] to the number of names or rows it processed.
+        """
+        stage = {"name": name, "items": items}
+        profiler = cProfile.Profile() if name in self.profile else None
+        start_rss = peak_rss_mb()
+        if tracemalloc is not None and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start_wall = time.time()
+        start_cpu = cpu_time()
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield stage
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            stage["wall_s"] = time.time() - start_wall
+            stage["cpu_s"] = cpu_time() - start_cpu
+            stage["peak_rss_mb"] = peak_rss_mb()
+            stage["rss_growth_mb"] = stage["peak_rss_mb"] - start_rss
+            if tracemalloc is not None:
+                stage["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024. ** 2
+            if stage["items"] is not None:
+                stage["items_per_s"] = stage["items"] / max(stage["wall_s"], 1e-9)
+            if profiler is not None:
+                stage["profile"] = self.profile_text(profiler)
+            self.stages.append(stage)
+
+    def profile_text(self, profiler):
+        """The top functions of the profile, by cumulative time"""
+        out = StringIO.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.profile_lines)
+        return out.getvalue()
+
+    def report(self):
+        """Returns the JSON-able dict of the run and its stages"""
+        return {"program": os.path.basename(sys.argv[0]),
+                "date": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start_wall)),
+                "wall_s": time.time() - self.start_wall,
+                "cpu_s": cpu_time() - self.start_cpu,
+                "peak_rss_mb": peak_rss_mb(),
+                "stages": self.stages}
+
+    def summary(self):
+        """Returns the human readable table of the stages"""
+        lines = ["%-16s %9s %9s %10s %10s %12s" % ("stage", "wall (s)", "cpu (s)", "peak (MB)",
+                                                     "+RSS (MB)", "items/s")]
+        for stage in self.stages:
+            rate = "%12.0f" % stage["items_per_s"] if "items_per_s" in stage else "%12s" % "-"
+            lines.append("%-16s %9.3f %9.3f %10.1f %10.1f %s" % (stage["name"], stage["wall_s"], stage["cpu_s"],
+                                                                stage["peak_rss_mb"], stage["rss_growth_mb"], rate))
+        report = self.report()
+        lines.append("%-16s %9.3f %9.3f %10.1f" % ("total", report["wall_s"], report["cpu_s"], report["peak_rss_mb"]))
+        for stage in self.stages:
+            if "profile" in stage:
+                lines += ["", "Profile of %s:" % stage["name"], stage["profile"]]
+
+        return "\n".join(lines)
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
@@ -0,0 +1,285 @@
+#Compiled store for the SSA baby names by state
+#The SSA state data (namesbystate.zip) has one file per state, e.g. namesbystate/AK.TXT,
+#with the lines "state,sex,year,name,count". Together the files are far larger than
+#the national yobYYYY.txt files and are organised by state rather than by year.
+#This program streams them once, a bounded number of lines at a time, and writes:
+#  state_store/years.npy          - the years covered (int32)
+#  state_store/names_F.txt        - one name table for all the states (line number = name ID)
+#  state_store/state_AK_F.npz     - the (name ID, year, count) entries of the state, sorted by
+#                                   name ID: the sparse layout of demographics.read_sparse_counts
+#  state_store/area_West_F.npy    - int32 matrix (name ID x year) for each Census region
+#  state_store/area_US_F.npy        and for the whole country
+#(and the same for M). The regional and national matrices are summed from the entries
+#of each state while they are in memory, so all the results come from one pass over the text.
+#A state, a region or "US" is an "area": area_counts() returns its counts in a form
+#demographics.get_stats_all_names() accepts, and area_name_stats() answers the
+#name_age.py question (mean, median, stddev, skewness, kurtosis) for one area.
+#Run "python state_store.py" after unzipping namesbystate.zip into namesbystate/,
+#then e.g. "python state_store.py Brittany F" for the median age in every region.
+
+import os
+import sys
+import glob
+import numpy as np
+import names_store
+import actuarial
+import weighted_stats
+
+
+STATE_STORE_DIR = "state_store"
+STATES_DIR = "namesbystate"
+CHUNK_BYTES = 16 * 1024 * 1024  #text read at a time
+
+#Census regions
+REGIONS = {"Northeast": ("CT", "ME", "MA", "NH", "RI", "VT", "NJ", "NY", "PA"),
+           "Midwest": ("IL", "IN", "MI", "OH", "WI", "IA", "KS", "MN", "MO", "NE", "ND", "SD"),
+           "South": ("DE", "DC", "FL", "GA", "MD", "NC", "SC", "VA", "WV", "AL", "KY", "MS", "TN",
+                     "AR", "LA", "OK", "TX"),
+           "West": ("AZ", "CO", "ID", "MT", "NV", "NM", "UT", "WY", "AK", "CA", "HI", "OR", "WA")}
+NATIONAL = "US"
+
+_loaded_stores = {}  #store directory -> loaded state store, one per process
+
+
+def read_state_lines(filename, chunk_bytes=CHUNK_BYTES):
+    """Generator over a state file: yields (states, sexes, years, names, counts)
+    columns for about chunk_bytes of text at a time (whole lines only)
+    """
+    with open(filename, "rb") as f:
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            fields = "".join(lines).replace("\r", "").strip().replace("\n", ",").split(",")
+            if len(fields) % 5 != 0:
+                raise ValueError("%s is not in the state,sex,year,name,count format" % filename)
+            yield (fields[0::5], fields[1::5], np.array(fields[2::5]).astype(np.int64),
+                   fields[3::5], np.array(fields[4::5]).astype(np.int64))
+
+
+def state_file(store_dir, state, sex):
+    return os.path.join(store_dir, "state_" + state + "_" + sex + ".npz")
+
+
+def area_file(store_dir, area, sex):
+    return os.path.join(store_dir, "area_" + area + "_" + sex + ".npy")
+
+
+def region_of(state):
+    for region, states in REGIONS.items():
+        if state in states:
+            return region
+    return None
+
+
+def add_entries(matrix, name_ids, year_index, counts):
+    """Adds the entries to the matrix, first growing it with zero rows for new names.
+    Returns the matrix (a new one if it had to grow).
+    """
+    if len(name_ids) > 0 and name_ids.max() >= matrix.shape[0]:
+        rows = max(name_ids.max() + 1, 2 * matrix.shape[0])  #doubling, to grow rarely
+        matrix = np.concatenate((matrix, np.zeros((rows - matrix.shape[0], matrix.shape[1]), dtype=matrix.dtype)))
+    np.add.at(matrix, (name_ids, year_index), counts)
+
+    return matrix
+
+
+def compile_state_store(years=range(1910, 2018), states_dir=STATES_DIR, store_dir=STATE_STORE_DIR,
+                        chunk_bytes=CHUNK_BYTES):
+    """Streams every STATE.TXT file of states_dir once and writes the store.
+    Only one state's entries and the regional and national matrices are in memory.
+    Returns a dict with the number of "lines" and the "states" found.
+    """
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    for filename in glob.glob(os.path.join(store_dir, "state_*.npz")) + glob.glob(os.path.join(store_dir, "area_*.npy")):
+        os.remove(filename)  #from an earlier compile
+    first_year = min(years)
+    n_years = len(years)
+
+    tables = {"F": [], "M": []}      #name tables
+    index = {"F": {}, "M": {}}       #name -> name ID
+    areas = {"F": {}, "M": {}}       #area -> matrix, grown as names are added
+    n_lines = 0
+    states_found = []
+
+    for filename in sorted(glob.glob(os.path.join(states_dir, "*.TXT"))):
+        entries = {}  #(state, sex) -> list of (name ID, year index, count) arrays
+        for states, sexes, line_years, names, counts in read_state_lines(filename, chunk_bytes):
+            if line_years.min() < first_year or line_years.max() >= first_year + n_years:
+                raise ValueError("%s has years outside %d-%d" % (filename, first_year, max(years)))
+            n_lines += len(names)
+
+            name_ids = np.empty(len(names), dtype=np.int64)
+            for line, (name, sex) in enumerate(zip(names, sexes)):
+                name_id = index[sex].get(name)
+                if name_id is None:
+                    name_id = index[sex][name] = len(tables[sex])
+                    tables[sex].append(name)
+                name_ids[line] = name_id
+
+            keys = np.array([state + "," + sex for state, sex in zip(states, sexes)])
+            for key in np.unique(keys):
+                lines = keys == key
+                entries.setdefault(tuple(key.split(",")), []).append(
+                    (name_ids[lines], line_years[lines] - first_year, counts[lines]))
+
+        for (state, sex), parts in sorted(entries.items()):
+            name_ids, year_index, counts = [np.concatenate(column) for column in zip(*parts)]
+
+            #regional and national totals in the same pass
+            for area in (region_of(state), NATIONAL):
+                if area is not None:
+                    matrix = areas[sex].get(area, np.zeros((0, n_years), dtype=np.int32))
+                    areas[sex][area] = add_entries(matrix, name_ids, year_index, counts)
+
+            filename = state_file(store_dir, state, sex)
+            if os.path.isfile(filename):  #the state was also in an earlier file
+                with np.load(filename) as data:
+                    name_ids = np.concatenate((data["name_ids"], name_ids))
+                    year_index = np.concatenate((data["year_index"], year_index))
+                    counts = np.concatenate((data["counts"], counts))
+            order = np.lexsort((year_index, name_ids))
+            np.savez(filename + ".tmp.npz", name_ids=name_ids[order].astype(np.int32),
+                     year_index=year_index[order].astype(np.int32), counts=counts[order].astype(np.int32))
+            os.rename(filename + ".tmp.npz", filename)
+            if state not in states_found:
+                states_found.append(state)
+
+    names_store.save_array(os.path.join(store_dir, "years.npy"), np.array(years, dtype=np.int32))
+    for sex in ("F", "M"):
+        names_store.save_lines(os.path.join(store_dir, "names_" + sex + ".txt"), tables[sex])
+        for area, matrix in areas[sex].items():
+            matrix = add_entries(matrix, np.array([len(tables[sex]) - 1]), np.array([0]), np.array([0]))
+            names_store.save_array(area_file(store_dir, area, sex), matrix[:len(tables[sex])])
+    names_store.save_lines(os.path.join(store_dir, "states.txt"), sorted(states_found))
+    _loaded_stores.pop(store_dir, None)
+
+    return {"lines": n_lines, "states": sorted(states_found)}
+
+
+def state_store_exists(store_dir=STATE_STORE_DIR):
+    return os.path.isfile(os.path.join(store_dir, "states.txt"))
+
+
+def load_state_store(store_dir=STATE_STORE_DIR):
+    """Loads the state store (once per process). Returns a dict with "years",
+    "states", "index" ((name, sex) -> name ID), "F" and "M" ({"names": name table}).
+    The state entries and area matrices are read when first asked for (area_counts).
+    """
+    if store_dir in _loaded_stores:
+        return _loaded_stores[store_dir]
+
+    store = {"dir": store_dir, "years": np.load(os.path.join(store_dir, "years.npy")), "index": {}}
+    with open(os.path.join(store_dir, "states.txt")) as f:
+        store["states"] = f.read().splitlines()
+    for sex in ("F", "M"):
+        with open(os.path.join(store_dir, "names_" + sex + ".txt")) as f:
+            names = f.read().splitlines()
+        store[sex] = {"names": names, "areas": {}}
+        store["index"].update(((name, sex), name_id) for name_id, name in enumerate(names))
+
+    _loaded_stores[store_dir] = store
+    return store
+
+
+def area_counts(store, area, sex):
+    """Returns the counts of an area (a state such as "CA", a region of REGIONS, or "US"):
+    an int32 (name ID x year) matrix for a region or the country, and for a state the
+    sparse dict of demographics.read_sparse_counts (names, indptr, year_index, counts, n_years).
+    Both work with demographics.get_stats_all_names().
+    """
+    cache = store[sex]["areas"]
+    if area in cache:
+        return cache[area]
+
+    names = store[sex]["names"]
+    if area == NATIONAL or area in REGIONS:
+        filename = area_file(store["dir"], area, sex)
+        if os.path.isfile(filename):
+            counts = np.load(filename, mmap_mode="r")
+        else:
+            counts = np.zeros((len(names), len(store["years"])), dtype=np.int32)  #no data in the area
+    elif area in store["states"]:
+        filename = state_file(store["dir"], area, sex)
+        counts = {"names": names, "n_years": len(store["years"])}
+        if os.path.isfile(filename):
+            with np.load(filename) as data:
+                name_ids = data["name_ids"]
+                counts["year_index"] = data["year_index"]
+                counts["counts"] = data["counts"]
+        else:  #no names of this sex in the state
+            name_ids = counts["year_index"] = counts["counts"] = np.zeros(0, dtype=np.int32)
+        counts["indptr"] = np.searchsorted(name_ids, np.arange(len(names) + 1)).astype(np.int64)
+    else:
+        raise ValueError("unknown area %r (a state, %s or %s)" % (area, ", ".join(sorted(REGIONS)), NATIONAL))
+
+    cache[area] = counts
+    return counts
+
+
+def get_area_name_counts(store, name, sex, area, years):
+    """State version of names_store.get_name_counts: the number of babies named name
+    in area for each of the years (all zeros for an unknown name)
+    """
+    columns = names_store.year_columns(store, years)
+    name_id = store["index"].get((name, sex))
+    if name_id is None:
+        return np.zeros(columns.stop - columns.start, dtype=np.int32)
+
+    counts = area_counts(store, area, sex)
+    if isinstance(counts, dict):
+        row = np.zeros(counts["n_years"], dtype=np.int32)
+        entries = slice(counts["indptr"][name_id], counts["indptr"][name_id + 1])
+        row[counts["year_index"][entries]] = counts["counts"][entries]
+    else:
+        row = np.array(counts[name_id])
+
+    return row[columns]
+
+
+def area_name_stats(store, name, sex, area, years, reference_year=None):
+    """calc_number_alive + analysis of name_age.py for one area.
+    Returns (number_alive, (mean, median, stddev, skewness, kurtosis))
+    """
+    alive_prob = actuarial.alive_prob(sex, years, reference_year=reference_year)
+    number_alive = get_area_name_counts(store, name, sex, area, years) * alive_prob
+
+    return (number_alive, weighted_stats.weighted_stats(number_alive, years))
+
+
+def main():
+
+    if len(sys.argv) > 2:
+        #python state_store.py NAME SEX: the median age of the name in every region
+        name, sex = sys.argv[1], sys.argv[2]
+        store = load_state_store()
+        years = store["years"].tolist()
+        print
+        for area in sorted(REGIONS) + [NATIONAL]:
+            number_alive, result = area_name_stats(store, name, sex, area, years)
+            print "%-10s median age of %s, %s: %0.1f" % (area, name, sex, max(years) - result[1])
+        print
+        return
+
+    if not os.path.isdir(STATES_DIR):
+        print "Unzip namesbystate.zip into %s/ first" % STATES_DIR
+        return
+
+    print
+    print "Compiling baby names by state from %s/ ... ... ..." % STATES_DIR
+    print
+
+    ingest = compile_state_store()
+    store = load_state_store()
+
+    print "Read %d lines of %d states" % (ingest["lines"], len(ingest["states"]))
+    print "Total number of unique Female names: ", len(store["F"]["names"])
+    print "Total number of unique Male names: ", len(store["M"]["names"])
+    print
+    print "... store written to %s/" % STATE_STORE_DIR
+    print
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,158 @@
+#Precomputed statistics for every name in the compiled store
+#demographics.py used to recompute the statistics of every name above the
+#threshold on each run. This program computes them once for every (name, sex):
+#  mean, median, stddev, skewness, kurtosis (of the birth years of those alive)
+#  total (all time number of babies) and alive (number expected to be alive)
+#and saves them column by column in names_store/stats_F.npz and stats_M.npz,
+#row = name ID of the store. The threshold and the demographics_filter criteria
+#are then just masks on these columns (see select), so trying many cutoffs is instant.
+#The table is rebuilt when the store's names or years change, or when the actuarial
+#table changes (its hash is saved with the table).
+#Run "python stats_table.py" after building (or appending to) the store.
+
+import os
+import numpy as np
+import names_store
+import actuarial
+import weighted_stats
+
+
+COLUMNS = ("mean", "median", "stddev", "skewness", "kurtosis", "total", "alive")
+STATS_COLUMNS = COLUMNS[:5]  #the columns from weighted_stats_matrix
+
+
+def compute_stats(counts, alive_prob, years, rows=None, chunk_size=4096):
+    """Returns a dict of the COLUMNS arrays for the given rows (default all)
+    of the (names x years) counts matrix, chunk_size rows at a time
+    """
+    if rows is None:
+        rows = np.arange(counts.shape[0])
+    alive_prob = np.asarray(alive_prob, dtype=float)
+
+    columns = dict((column, np.zeros(len(rows))) for column in COLUMNS)
+    columns["total"] = np.zeros(len(rows), dtype=np.int64)
+
+    for start in range(0, len(rows), chunk_size):
+        stop = min(start + chunk_size, len(rows))
+        block = np.asarray(counts[rows[start:stop]])
+        number_alive = block * alive_prob
+        columns["total"][start:stop] = block.sum(axis=1, dtype=np.int64)
+        columns["alive"][start:stop] = number_alive.sum(axis=1)
+        block_stats = weighted_stats.weighted_stats_matrix(number_alive, years)
+        for column, block_stat in zip(STATS_COLUMNS, block_stats):
+            columns[column][start:stop] = block_stat
+
+    return columns
+
+
+def build_stats_table(store):
+    """Computes the statistics of every name of both sexes in the store.
+    The probability to be alive is for the last year of the store.
+    Returns the table: a dict with "years", "reference_year", "actuarial_version"
+    (see actuarial.table_version), "F" and "M", where table["F"] is a dict of
+    COLUMNS arrays (row = name ID).
+    """
+    years = store["years"].tolist()
+    reference_year = max(years)
+
+    table = {"years": np.array(years), "reference_year": reference_year,
+             "actuarial_version": actuarial.table_version()}
+    for sex in ("F", "M"):
+        alive_prob = actuarial.alive_prob(sex, years, reference_year=reference_year)
+        table[sex] = compute_stats(store[sex]["counts"], alive_prob, years)
+
+    return table
+
+
+def save_stats_table(table, store_dir=names_store.STORE_DIR):
+    for sex in ("F", "M"):
+        filename = os.path.join(store_dir, "stats_" + sex + ".npz")
+        temp_filename = filename + ".tmp.npz"
+        np.savez(temp_filename, years=table["years"], reference_year=table["reference_year"],
+                 actuarial_version=table["actuarial_version"], **table[sex])
+        os.rename(temp_filename, filename)
+
+
+def load_stats_table(store_dir=names_store.STORE_DIR):
+    """Returns the saved table, or None if there is none (or it lacks a column)"""
+    table = {}
+    for sex in ("F", "M"):
+        filename = os.path.join(store_dir, "stats_" + sex + ".npz")
+        if not os.path.isfile(filename):
+            return None
+        with np.load(filename) as data:
+            if any(column not in data.files for column in COLUMNS + ("actuarial_version",)):
+                return None  #saved by an older version
+            table["years"] = data["years"]
+            table["reference_year"] = int(data["reference_year"])
+            table["actuarial_version"] = str(data["actuarial_version"])
+            table[sex] = dict((column, data[column]) for column in COLUMNS)
+
+    return table
+
+
+def is_current(table, store):
+    """True if the table was built from the store and the actuarial table as they are now"""
+    if table is None or not np.array_equal(table["years"], store["years"]):
+        return False
+    if table["actuarial_version"] != actuarial.table_version():
+        return False
+    for sex in ("F", "M"):
+        if not np.array_equal(table[sex]["total"], store[sex]["totals"]):
+            return False
+
+    return True
+
+
+def load_or_build_stats_table(store_dir=names_store.STORE_DIR):
+    """Returns the saved table, (re)building and saving it first if it is out of date"""
+    store = names_store.load_names_store(store_dir)
+    table = load_stats_table(store_dir)
+    if not is_current(table, store):
+        table = build_stats_table(store)
+        save_stats_table(table, store_dir)
+
+    return table
+
+
+def select(table, sex, threshold=0, max_stddev=None, min_kurtosis=None):
+    """Returns the name IDs with total > threshold,
+    and (if given) stddev < max_stddev and kurtosis > min_kurtosis
+    (demographics_filter uses max_stddev=15, min_kurtosis=0)
+    """
+    columns = table[sex]
+    mask = columns["total"] > threshold
+    with np.errstate(invalid="ignore"):  #nan (nobody alive) never passes
+        if max_stddev is not None:
+            mask &= columns["stddev"] < max_stddev
+        if min_kurtosis is not None:
+            mask &= columns["kurtosis"] > min_kurtosis
+
+    return np.nonzero(mask)[0]
+
+
+def results_dict(table, sex, rows, names):
+    """Returns the demographics.py results dict name: (mean, median, stddev, sk, kurt, total, alive)
+    for the given name IDs. names is the store name table of sex.
+    """
+    columns = [table[sex][column] for column in COLUMNS]
+    results = {}
+    for row in rows:
+        mean, median, stddev, sk, kurt, total, alive = [column[row] for column in columns]
+        results[names[row]] = (mean, median, stddev, sk, kurt, int(total), alive)
+
+    return results
+
+
+def main():
+
+    print
+    print "Computing the statistics of every name in the compiled store ..."
+    table = load_or_build_stats_table()
+    print "Female names: %d, Male names: %d" % (len(table["F"]["total"]), len(table["M"]["total"]))
+    print "... saved in %s/" % names_store.STORE_DIR
+    print
+
+
+if __name__ == '__main__':
+  main()
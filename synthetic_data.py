@@ -0,0 +1,195 @@
+#Synthetic SSA baby names data for scaling tests
+#Writes names/yobYYYY.txt files in the SSA "name,sex,count" format (females first,
+#then males, each by decreasing count, only counts >= 5 like the SSA files) and an
+#actuarial table with the 9 column layout of adj_act_data_2014.txt, so the whole
+#pipeline (names_store.py, demographics.py, name_age.py, benchmark.py) can be
+#run on data 10x or 100x the size of the national data, e.g. to stand in for
+#state level or international name registries.
+#Every name has a total number of babies (Zipf distributed: the name of popularity
+#rank r gets ~ 1 / r**skew of the births), a peak year (uniform over the years) and
+#a peak width (log-normal around peak_width years); its count in a year is the
+#Poisson draw of the babies its Gaussian popularity curve puts in that year.
+#The output only depends on the parameters and the seed.
+#  python synthetic_data.py out_dir [scale]
+#then run the programs from out_dir (they read names/ and the actuarial file there).
+
+import os
+import sys
+import numpy as np
+import scipy.special
+import get_actdata_2014
+
+
+CONSONANTS = "bcdfghjklmnprstvz"
+VOWELS = "aeiou"
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS]
+
+MIN_COUNT = 5   #the SSA files leave out names given to fewer than 5 babies
+SEX_OVERLAP = 0.1  #fraction of the male names that are also female names
+
+#Gompertz-Makeham death probabilities: 1 - exp(-(A + B exp(C age))), plus infant mortality
+MORTALITY = {"M": {"A": 0.0005, "B": 0.00004, "C": 0.092, "infant": 0.0063},
+             "F": {"A": 0.0003, "B": 0.00002, "C": 0.095, "infant": 0.0052}}
+MAX_AGE = 119   #like the SSA actuarial table, ages 0 to 119
+
+
+def make_name(index):
+    """Returns the synthetic name number index (0, 1, 2, ...), e.g. "Baba".
+    Names have two syllables first, then three, and so on, so they are all different.
+    """
+    length = 2
+    while index >= len(SYLLABLES) ** length:
+        index -= len(SYLLABLES) ** length
+        length += 1
+
+    syllables = []
+    for i in range(length):
+        index, syllable = divmod(index, len(SYLLABLES))
+        syllables.append(SYLLABLES[syllable])
+
+    return "".join(reversed(syllables)).capitalize()
+
+
+def make_names(n_names, first=0):
+    return [make_name(index) for index in range(first, first + n_names)]
+
+
+def name_parameters(n_names, years, skew, peak_width, births, random):
+    """Returns (totals, peaks, widths) arrays for n_names names, most popular first.
+    births is the number of babies per year, shared by all the names.
+    """
+    ranks = np.arange(1, n_names + 1)
+    share = ranks ** -float(skew)
+    totals = births * len(years) * share / share.sum()
+    peaks = random.uniform(min(years) - 0.5, max(years) + 0.5, n_names)
+    widths = peak_width * random.lognormal(0, 0.5, n_names)
+
+    return (totals, peaks, widths)
+
+
+def year_counts(year, totals, peaks, widths, random):
+    """Returns the (Poisson) number of babies of every name in year:
+    the mass of each name's Gaussian curve between year - 0.5 and year + 0.5
+    """
+    mass = (scipy.special.ndtr((year + 0.5 - peaks) / widths)
+            - scipy.special.ndtr((year - 0.5 - peaks) / widths))
+
+    return random.poisson(totals * mass)
+
+
+def year_lines(names, sex, counts):
+    """Given the array of names and their counts,
+    returns the SSA file lines for one sex: counts >= MIN_COUNT,
+    by decreasing count, then by name
+    """
+    rows = np.nonzero(counts >= MIN_COUNT)[0]
+    rows = rows[np.lexsort((names[rows], -counts[rows]))]
+
+    return ["%s,%s,%d" % (names[row], sex, counts[row]) for row in rows]
+
+
+def write_names_files(years, names_dir, n_names=50000, skew=1.1, peak_width=12,
+                      births=1500000, seed=0):
+    """Writes names_dir/yobYYYY.txt for every year.
+    n_names is the number of names of each sex, births the number of babies
+    of each sex per year (before the MIN_COUNT cut).
+    Returns the number of lines written.
+    """
+    random = np.random.RandomState(seed)
+    first_M = int(n_names * (1 - SEX_OVERLAP))
+    names = {"F": np.array(make_names(n_names)), "M": np.array(make_names(n_names, first_M))}
+    random.shuffle(names["M"])  #shared names get an unrelated popularity
+
+    parameters = {}
+    for sex in ("F", "M"):
+        parameters[sex] = name_parameters(n_names, years, skew, peak_width, births, random)
+
+    if not os.path.isdir(names_dir):
+        os.makedirs(names_dir)
+
+    n_lines = 0
+    for year in years:
+        lines = []
+        for sex in ("F", "M"):
+            counts = year_counts(year, *(parameters[sex] + (random,)))
+            lines += year_lines(names[sex], sex, counts)
+        with open(os.path.join(names_dir, "yob" + str(year) + ".txt"), "wb") as f:
+            f.write("".join(line + "\r\n" for line in lines))  #the SSA files have Windows line breaks
+        n_lines += len(lines)
+
+    return n_lines
+
+
+def death_probability(sex, ages):
+    mortality = MORTALITY[sex]
+    hazard = mortality["A"] + mortality["B"] * np.exp(mortality["C"] * np.asarray(ages, dtype=float))
+    death_prob = 1 - np.exp(-hazard)
+    death_prob[0] = mortality["infant"]
+
+    return death_prob
+
+
+def life_expectancy(death_prob):
+    """Remaining years of life at each age, with deaths in the middle of the year"""
+    alive = np.concatenate(([1.], get_actdata_2014.survival_probability(death_prob)))
+    person_years = (alive[:-1] + alive[1:]) / 2
+    remaining = np.cumsum(person_years[::-1])[::-1]
+
+    return remaining / alive[:-1]
+
+
+def make_actuarial_dict():
+    """Returns a synthetic table in the get_actuarial_website_data() format:
+    age (0 to 119): (M death prob., M life expectancy, F death prob., F life expectancy)
+    """
+    ages = np.arange(MAX_AGE + 1)
+    columns = []
+    for sex in ("M", "F"):
+        death_prob = death_probability(sex, ages)
+        columns += [death_prob, life_expectancy(death_prob)]
+
+    return dict((age, tuple(float(column[age]) for column in columns)) for age in ages.tolist())
+
+
+def write_actuarial_file(years, filename):
+    """Writes the synthetic actuarial table for years, in the adj_act_data_2014.txt layout"""
+    fixed_data = get_actdata_2014.fixed_actuarial_data(make_actuarial_dict(), years)
+    get_actdata_2014.write_actdata_file(fixed_data, filename)
+
+
+def make_dataset(out_dir, years=range(1880, 2018), scale=1, **options):
+    """Writes out_dir/names/yobYYYY.txt and out_dir/adj_act_data_2014.txt.
+    scale multiplies the number of names and of babies (default options: about
+    the size of the national data).
+    Returns the number of names file lines written.
+    """
+    options.setdefault("n_names", 50000)
+    options.setdefault("births", 1500000)
+    options["n_names"] = int(options["n_names"] * scale)
+    options["births"] = int(options["births"] * scale)
+
+    n_lines = write_names_files(years, os.path.join(out_dir, "names"), **options)
+    write_actuarial_file(years, os.path.join(out_dir, "adj_act_data_2014.txt"))
+
+    return n_lines
+
+
+def main():
+
+    if len(sys.argv) < 2:
+        print "usage: python synthetic_data.py out_dir [scale]"
+        return
+    out_dir = sys.argv[1]
+    scale = 1
+    if len(sys.argv) > 2:
+        scale = float(sys.argv[2])
+
+    print
+    print "Writing synthetic SSA data (%gx) to %s/ ..." % (scale, out_dir)
+    n_lines = make_dataset(out_dir, scale=scale)
+    print "%d lines in %s/names/, actuarial table in %s/adj_act_data_2014.txt" % (n_lines, out_dir, out_dir)
+    print
+
+
+if __name__ == '__main__':
+  main()
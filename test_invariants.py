@@ -0,0 +1,556 @@
+#Invariants of the rewritten pipeline, checked against the straightforward versions
+#  weighted_stats - the same statistics and quantiles as expanding the histogram (integer
+#                   weights), the highest density interval of a brute force search, and
+#                   the same answer for a matrix row as for the vector on its own
+#  names_store    - a pool build is the same as a sequential one, and appending a year
+#                   is the same as compiling everything again
+#  multimodal     - the mixture fit of people far from every component (no underflow to nan)
+#  cohorts        - the same bins as the original if/elif ladder of demographics.py
+#  bootstrap      - the same bands whatever the number of processes
+#  name_age       - the batch and the server give the single name answer, for any years
+#  name_age_server - the JSON answers (null, never NaN), errors and counters under concurrent clients
+#  result_cache   - least recently used eviction, byte counts and invalidation
+#  name_lookup    - fuzzy search finds the names a scan of every name with the edit distance finds
+#The names data is written by synthetic_data.py to a temporary directory.
+#  python -m unittest test_invariants
+
+import os
+import time
+import shutil
+import tempfile
+import json
+import cPickle
+import urllib
+import urllib2
+import threading
+import unittest
+import numpy as np
+import scipy.stats as st
+import synthetic_data
+import names_store
+import weighted_stats
+import cohorts
+import multimodal
+import bootstrap
+import name_lookup
+import result_cache
+import actuarial
+import name_age
+import name_age_server
+
+
+YEARS = range(1880, 1900)
+STORE_YEARS = range(1880, 1951)  #the years of the synthetic store (and actuarial table)
+STORE_FILES = ("years.npy", "counts_F.npy", "counts_M.npy", "totals_F.npy", "totals_M.npy",
+               "names_F.txt", "names_M.txt")
+
+
+def expanded_stats(weights, years):
+    """The original get_stats: one entry per person"""
+    data = np.repeat(years, weights)
+    return (np.mean(data), np.median(data), np.std(data), st.skew(data), st.kurtosis(data))
+
+
+def expanded_quantile(weights, years, q):
+    """The q quantile of the expanded histogram: the (averaged) inverted CDF,
+    i.e. np.median's rule for any q
+    """
+    data = np.repeat(years, weights)
+    position = q * len(data)
+    if q == 0:
+        return data[0]
+    if position == int(position) and position < len(data):
+        return (data[int(position) - 1] + data[int(position)]) / 2.0
+    return data[int(np.ceil(position)) - 1]
+
+
+def brute_force_interval(weights, years, mass):
+    """The shortest (then fullest, then earliest) range of years holding mass of the weight,
+    trying every first and last year
+    """
+    total = float(sum(weights))
+    best = None
+    for first in range(len(years)):
+        for last in range(first, len(years)):
+            held = sum(weights[first:last + 1])
+            if held >= mass * total - 1e-9 * total:
+                key = (years[last] - years[first], -held, first)
+                if best is None or key < best[0]:
+                    best = (key, (years[first], years[last]))
+                break
+
+    return best[1]
+
+
+def levenshtein(word, other):
+    """The textbook dynamic programming edit distance"""
+    previous = range(len(other) + 1)
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other_char in enumerate(other, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other_char)))
+        previous = current
+
+    return previous[-1]
+
+
+def mutate(word, random, edits):
+    """word with edits random deletions, insertions and substitutions"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for edit in range(edits):
+        position = random.randint(len(word) + 1)
+        kind = random.randint(3) if word else 1
+        if kind == 0:
+            word = word[:position - 1] + word[position:] if position else word[1:]
+        elif kind == 1:
+            word = word[:position] + letters[random.randint(26)] + word[position:]
+        else:
+            position = min(position, len(word) - 1)
+            word = word[:position] + letters[random.randint(26)] + word[position + 1:]
+
+    return word
+
+
+def ladder_cohort(median):
+    """The original demographics_analysis: the position of the generation of median"""
+    if median > 2000:
+        return 0
+    elif median > 1980:
+        return 1
+    elif median > 1964:
+        return 2
+    elif median > 1944:
+        return 3
+    elif median > 1926:
+        return 4
+    elif median > 1900:
+        return 5
+    else:
+        return 6
+
+
+class WeightedStatsTest(unittest.TestCase):
+
+    def test_matches_expanded_histogram(self):
+        """user-003: the weighted statistics are those of the expanded histogram"""
+        random = np.random.RandomState(0)
+        years = np.arange(1880, 2018)
+        for trial in range(20):
+            weights = random.poisson(random.uniform(0, 50), len(years))
+            weights[random.uniform(size=len(years)) < 0.5] = 0
+            if weights.sum() == 0:
+                continue
+            expected = expanded_stats(weights, years)
+            np.testing.assert_allclose(weighted_stats.weighted_stats(weights, years), expected,
+                                       rtol=1e-9, atol=1e-9)
+
+            matrix = weighted_stats.weighted_stats_matrix(weights[np.newaxis, :], years)
+            np.testing.assert_allclose([stat[0] for stat in matrix], expected, rtol=1e-9, atol=1e-9)
+
+    def random_weights(self, random, n_years):
+        weights = random.poisson(random.uniform(0, 20), n_years)
+        weights[random.uniform(size=n_years) < random.uniform(0, 0.9)] = 0
+        weights[random.randint(n_years)] += 1  #somebody alive
+        return weights
+
+    def test_quantiles(self):
+        """user-023: quantiles of the weights = quantiles of the expanded histogram"""
+        random = np.random.RandomState(1)
+        years = np.arange(1900, 1940)
+        q = [0, 0.05, 0.25, 0.5, 0.75, 0.9, 1]
+        for trial in range(300):
+            weights = self.random_weights(random, len(years))
+            expected = [expanded_quantile(weights, years, fraction) for fraction in q]
+            np.testing.assert_allclose(weighted_stats.weighted_quantiles(weights, years, q), expected)
+            self.assertEqual(weighted_stats.weighted_quantiles(weights, years, 0.5),
+                             np.median(np.repeat(years, weights)))
+
+    def test_highest_density_interval(self):
+        """user-023: the highest density interval is the brute force shortest range"""
+        random = np.random.RandomState(2)
+        years = np.arange(1900, 1930)
+        for trial in range(300):
+            weights = self.random_weights(random, len(years))
+            for mass in (0.5, 0.9, random.uniform(0.01, 1)):
+                self.assertEqual(weighted_stats.highest_density_interval(weights, years, mass),
+                                 brute_force_interval(weights, years, mass))
+
+    def test_matrix_rows(self):
+        """user-023: every row of a matrix gives the single vector answer (an empty row nan)"""
+        random = np.random.RandomState(3)
+        years = np.arange(1900, 1960)
+        matrix = np.array([self.random_weights(random, len(years)) * random.uniform(0.1, 3)
+                           for row in range(50)])
+        matrix[7] = 0
+
+        stats = weighted_stats.weighted_stats_matrix(matrix, years)
+        quantiles = weighted_stats.weighted_quantiles(matrix, years, [0.1, 0.5, 0.9])
+        low, high = weighted_stats.highest_density_interval(matrix, years, 0.9)
+        for row, weights in enumerate(matrix):
+            np.testing.assert_allclose([stat[row] for stat in stats],
+                                       weighted_stats.weighted_stats(weights, years), rtol=1e-9)
+            np.testing.assert_array_equal(quantiles[row],
+                                          weighted_stats.weighted_quantiles(weights, years, [0.1, 0.5, 0.9]))
+            np.testing.assert_array_equal((low[row], high[row]),
+                                          weighted_stats.highest_density_interval(weights, years, 0.9))
+
+    def test_single_year(self):
+        """user-003: a name born in a single year (no spread) as the expanded histogram"""
+        weights = np.zeros(10)
+        weights[3] = 7
+        np.testing.assert_allclose(weighted_stats.weighted_stats(weights, range(10)),
+                                   expanded_stats(weights.astype(int), range(10)))
+
+
+class NamesStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp(prefix="test_invariants")
+        cls.names_dir = os.path.join(cls.temp_dir, "names")
+        synthetic_data.write_names_files(YEARS, cls.names_dir, n_names=2000, births=50000)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def compile(self, name, years, processes):
+        store_dir = os.path.join(self.temp_dir, name)
+        names_store.compile_names_store(years, names_dir=self.names_dir, store_dir=store_dir,
+                                        processes=processes)
+        return store_dir
+
+    def assertSameStore(self, store_dir, other_dir):
+        for filename in STORE_FILES:
+            with open(os.path.join(store_dir, filename), "rb") as f:
+                data = f.read()
+            with open(os.path.join(other_dir, filename), "rb") as f:
+                self.assertEqual(data, f.read(), filename + " differs")
+
+        name_index = []
+        for directory in (store_dir, other_dir):
+            with open(os.path.join(directory, "name_index.pkl"), "rb") as f:
+                name_index.append(cPickle.load(f))
+        self.assertEqual(name_index[0], name_index[1])
+
+    def test_pool_build(self):
+        """user-006: a build reading the years in a pool of processes is the sequential build"""
+        sequential = self.compile("sequential", YEARS, processes=1)
+        self.assertSameStore(sequential, self.compile("pool", YEARS, processes=3))
+
+    def test_append_year(self):
+        """user-013: appending a year is the same as compiling every year again"""
+        full = self.compile("full", YEARS, processes=1)
+        appended = self.compile("appended", YEARS[:-1], processes=1)
+        changed = names_store.append_year(YEARS[-1], names_dir=self.names_dir, store_dir=appended)
+
+        self.assertSameStore(full, appended)
+        for sex in ("F", "M"):
+            counts = np.load(os.path.join(full, "counts_" + sex + ".npy"))
+            np.testing.assert_array_equal(changed[sex], np.nonzero(counts[:, -1])[0])
+
+
+class SyntheticStoreTest(unittest.TestCase):
+    """Runs the tests in a temporary directory holding synthetic names files,
+    a matching actuarial table and the compiled store, like a user's working directory
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.temp_dir = tempfile.mkdtemp(prefix="test_invariants")
+        synthetic_data.make_dataset(cls.temp_dir, years=STORE_YEARS, n_names=1000, births=30000)
+        os.chdir(cls.temp_dir)
+        names_store._loaded_stores.clear()
+        name_lookup._lookups.clear()
+        names_store.compile_names_store(STORE_YEARS)
+        cls.store = names_store.load_names_store()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.temp_dir)
+        names_store._loaded_stores.clear()  #keyed by the relative directory
+        name_lookup._lookups.clear()
+
+    def popular_names(self, sex, n):
+        totals = self.store[sex]["totals"]
+        return [self.store[sex]["names"][row] for row in np.argsort(-totals)[:n]]
+
+
+class NameAgeTest(SyntheticStoreTest):
+    """user-013: "today" is the store's last year, not the last of the years asked for"""
+
+    def single_name(self, name, sex, years):
+        number_alive = name_age.calc_number_alive(name, sex, years)
+        return name_age.analysis(number_alive, years)
+
+    def test_batch_sub_range(self):
+        years = range(1890, 1931)
+        pairs = [(name, "F") for name in self.popular_names("F", 5)] + \
+                [(name, "M") for name in self.popular_names("M", 5)]
+        number_alive, results = name_age.calc_number_alive_batch(pairs, years)
+        for (name, sex), result in zip(pairs, results):
+            np.testing.assert_allclose(result, self.single_name(name, sex, years), rtol=1e-9)
+
+    def test_server_sub_range(self):
+        years = range(1890, 1931)
+        data = name_age_server.NameAgeData(years)
+        for name in self.popular_names("F", 3):
+            estimate = data.estimate(name, "F")
+            mean, median = self.single_name(name, "F", years)[:2]
+            self.assertAlmostEqual(estimate["median_year"], median)
+            self.assertAlmostEqual(estimate["median_age"], STORE_YEARS[-1] - median)
+            self.assertAlmostEqual(estimate["mean_age"], STORE_YEARS[-1] - mean)
+
+
+class NameAgeServerTest(SyntheticStoreTest):
+    """user-009: the HTTP answers of name_age_server.py, and its counters under concurrent clients"""
+
+    def setUp(self):
+        self.server = name_age_server.make_server(port=0)
+        self.host, self.port = self.server.server_address
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, path, **query):
+        """Returns the status and the text of the answer to GET path?query"""
+        url = "http://%s:%d%s?%s" % (self.host, self.port, path, urllib.urlencode(query))
+        try:
+            response = urllib2.urlopen(url)
+        except urllib2.HTTPError as error:
+            response = error
+
+        return response.getcode(), response.read()
+
+    def test_age(self):
+        name = self.popular_names("M", 1)[0]
+        status, text = self.get("/age", name=name.lower(), sex="M")
+        self.assertEqual(status, 200)
+
+        result = json.loads(text)
+        mean, median = name_age.analysis(name_age.calc_number_alive(name, "M", STORE_YEARS), STORE_YEARS)[:2]
+        self.assertEqual(result["name"], name)  #the store spelling
+        self.assertEqual(result["sex"], "M")
+        self.assertEqual(result["total_born"], int(self.store["M"]["totals"][self.store["index"][(name, "M")]]))
+        self.assertAlmostEqual(result["median_year"], median)
+        self.assertAlmostEqual(result["mean_age"], STORE_YEARS[-1] - mean)
+        for band in ("born_50", "born_90"):
+            self.assertTrue(STORE_YEARS[0] <= result[band][0] <= median <= result[band][1] <= STORE_YEARS[-1])
+        for key in ("stddev", "skewness", "kurtosis", "number_alive"):
+            self.assertIn(key, result)
+
+    def test_unknown_name(self):
+        name = self.popular_names("F", 1)[0]
+        misspelled = name[:2] + "q" + name[3:]
+        self.assertEqual(name_lookup.load_name_lookup().find(misspelled), [])
+
+        status, text = self.get("/age", name=misspelled, sex="F")
+        self.assertEqual(status, 404)
+        result = json.loads(text)
+        self.assertIn("error", result)
+        self.assertEqual(result["suggestions"][0], name)  #the most popular name one edit away
+
+    def test_bad_request(self):
+        name = self.popular_names("F", 1)[0]
+        for query in ({"name": name, "sex": "X"}, {"name": name}, {"name": "", "sex": "F"}):
+            status, text = self.get("/age", **query)
+            self.assertEqual(status, 400)
+            self.assertIn("error", json.loads(text))
+
+    def test_nobody_alive(self):
+        data = self.server.data
+        data.alive_prob = {"F": np.zeros(len(data.years)), "M": data.alive_prob["M"]}
+        status, text = self.get("/age", name=self.popular_names("F", 1)[0], sex="F")
+        self.assertEqual(status, 200)
+        self.assertNotIn("NaN", text)
+
+        result = json.loads(text)
+        self.assertEqual(result["number_alive"], 0)
+        for key in ("mean_year", "median_year", "mean_age", "stddev"):
+            self.assertIsNone(result[key])
+        self.assertEqual(result["born_50"], [None, None])
+
+    def test_concurrent_stats(self):
+        names = [(name, "F") for name in self.popular_names("F", 4)] + [("Nobodyatall", "M")]
+        before = name_age_server.query_server_stats(self.host, self.port)
+
+        def client():
+            for name, sex in names * 4:
+                name_age_server.query_name_age(name, sex, self.host, self.port)
+        clients = [threading.Thread(target=client) for i in range(6)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+        #a request is counted after its answer is sent, so the last ones may still be counting
+        for attempt in range(100):
+            after = name_age_server.query_server_stats(self.host, self.port)
+            if after["requests"] - before["requests"] >= 6 * 4 * len(names):
+                break
+            time.sleep(0.01)
+        self.assertEqual(after["requests"] - before["requests"], 6 * 4 * len(names))
+        self.assertEqual(after["errors"] - before["errors"], 6 * 4)  #the unknown name
+        cache = after["cache"]
+        self.assertEqual(cache["hits"] + cache["misses"] - before["cache"]["hits"] - before["cache"]["misses"],
+                         6 * 4 * 4)
+        self.assertGreater(cache["hits"], before["cache"]["hits"])
+        self.assertGreaterEqual(after["latency_ms"]["max"], after["latency_ms"]["p50"])
+
+
+class ResultCacheTest(SyntheticStoreTest):
+    """user-010: least recently used eviction, byte counts and invalidation when a data file changes"""
+
+    def test_eviction_order(self):
+        values = dict((name, np.zeros(100)) for name in "abcde")
+        size = result_cache.size_of(values["a"])
+        cache = result_cache.ResultCache(max_bytes=3 * size)
+
+        for name in "abc":
+            cache.put(name, "F", YEARS, values[name])
+        self.assertIs(cache.get("a", "F", YEARS), values["a"])  #b is now the oldest
+        cache.put("d", "F", YEARS, values["d"])
+        self.assertEqual([key[0] for key in cache.entries], ["c", "a", "d"])
+
+        cache.put("c", "F", YEARS, values["c"])  #replaced, not counted twice
+        cache.put("e", "F", YEARS, values["e"])
+        self.assertEqual([key[0] for key in cache.entries], ["d", "c", "e"])
+        self.assertIsNone(cache.get("a", "F", YEARS))
+
+        info = cache.info()
+        self.assertEqual(info["evictions"], 2)
+        self.assertEqual((info["hits"], info["misses"]), (1, 1))
+
+    def test_bytes(self):
+        cache = result_cache.ResultCache(max_bytes=10 ** 6)
+        values = {"a": np.zeros(1000), "b": {"mean_year": 1950.0, "born_50": [1940, 1960]},
+                  "c": (np.ones(10), 3), "d": None}
+        for name, value in values.iteritems():
+            cache.put(name, "M", YEARS, value)
+        cache.put("a", "M", YEARS, values["a"])
+        self.assertEqual(cache.info()["bytes"], sum(result_cache.size_of(value) for value in values.values()))
+        self.assertEqual(cache.info()["bytes"], sum(size for value, size in cache.entries.values()))
+
+        cache.put("big", "M", YEARS, np.zeros(10 ** 6))  #over max_bytes on its own: not kept
+        self.assertEqual(len(cache.entries), len(values))
+        self.assertEqual(cache.info()["evictions"], 0)
+
+    def test_invalidation(self):
+        calls = []
+        def on_invalidate():
+            calls.append(cache.lock.locked())  #a reload under the lock would stall every request
+        cache = result_cache.ResultCache(check_interval=0, on_invalidate=on_invalidate)
+        cache.put("a", "F", YEARS, 1.0)
+        self.assertEqual(cache.get("a", "F", YEARS), 1.0)
+        self.assertEqual(calls, [])
+
+        info = os.stat(actuarial.ACTUARIAL_FILE)
+        os.utime(actuarial.ACTUARIAL_FILE, (info.st_atime, info.st_mtime + 10))
+        self.assertIsNone(cache.get("a", "F", YEARS))
+        self.assertEqual(calls, [False])  #called once, outside the lock
+        self.assertEqual((cache.info()["invalidations"], cache.info()["bytes"]), (1, 0))
+
+        cache.put("a", "F", YEARS, 2.0)
+        self.assertEqual(cache.get("a", "F", YEARS), 2.0)
+        self.assertEqual(len(calls), 1)
+
+
+class NameLookupTest(SyntheticStoreTest):
+    """user-021: the deletion index finds exactly the names a scan of every name finds"""
+
+    def test_fuzzy_matches_brute_force(self):
+        lookup = name_lookup.load_name_lookup()
+        entries = [(name, sex, int(total)) for sex in ("F", "M")
+                   for name, total in zip(self.store[sex]["names"], self.store[sex]["totals"])]
+
+        random = np.random.RandomState(0)
+        for query in range(150):
+            name = entries[random.randint(len(entries))][0]
+            query = mutate(name, random, random.randint(4))
+            max_distance = random.randint(3)
+
+            expected = set()
+            for name, sex, total in entries:
+                distance = levenshtein(query.lower(), name.lower())
+                if distance <= max_distance:
+                    expected.add((name, sex, total, distance))
+
+            found = lookup.fuzzy(query, max_distance=max_distance, limit=None)
+            self.assertEqual(set(found), expected, query)
+            self.assertEqual(len(found), len(expected))
+            ranks = [(distance, -total) for name, sex, total, distance in found]
+            self.assertEqual(ranks, sorted(ranks), query)
+
+    def test_edit_distances(self):
+        lookup = name_lookup.load_name_lookup()
+        random = np.random.RandomState(1)
+        for query in ("", "a", "jennifer", mutate("christopher", random, 3)):
+            distances = name_lookup.edit_distances(query, lookup.key_codes, lookup.key_lengths)
+            self.assertEqual(distances.tolist(), [levenshtein(query, key) for key in lookup.keys])
+
+
+class MultimodalTest(unittest.TestCase):
+
+    def test_far_from_every_component(self):
+        """user-025: a few people born 30-60 years from the only component (all its densities
+        underflow there) still give the exact single Gaussian fit, without nan or warnings
+        """
+        years = np.arange(1880, 2018)
+        for far in range(30, 61):
+            weights = np.zeros((1, len(years)))
+            weights[0, 20] = 1000
+            weights[0, 20 + far] = 0.1
+            with np.errstate(all="raise"):
+                mixture = multimodal.fit_mixture(weights, years, components=1)
+
+            share = weights[0] / weights.sum()
+            mean = (share * years).sum()
+            loglik = (share * (-0.5 * np.log(2 * np.pi) - 0.5 * (years - mean) ** 2)).sum()  #sigma 1
+            self.assertAlmostEqual(mixture["weight"][0, 0], 1)
+            self.assertAlmostEqual(mixture["mean"][0, 0], mean)
+            self.assertEqual(mixture["sigma"][0, 0], 1)
+            self.assertAlmostEqual(mixture["loglik"][0], loglik, places=5)
+
+
+class CohortsTest(unittest.TestCase):
+
+    def test_matches_ladder(self):
+        """user-016: the cohort bins are those of the if/elif ladder, bounds and nan included"""
+        random = np.random.RandomState(0)
+        bounds = [year for label, year in cohorts.GENERATIONS if year is not None]
+        median = np.concatenate((random.uniform(1850, 2020, 1000), bounds,
+                                 np.array(bounds) + 0.5, [np.nan]))
+
+        expected = [ladder_cohort(value) for value in median]
+        np.testing.assert_array_equal(cohorts.assign_cohorts(median), expected)
+
+
+class BootstrapTest(unittest.TestCase):
+
+    def test_processes(self):
+        """user-024: the bootstrap bands do not depend on the number of processes"""
+        random = np.random.RandomState(0)
+        years = np.arange(1880, 2018)
+        counts = random.poisson(20, (30, len(years)))
+        alive_prob = np.linspace(0, 1, len(years))
+
+        block_rows = bootstrap.BLOCK_ROWS
+        bootstrap.BLOCK_ROWS = 500  #several blocks of 10 names
+        try:
+            bands = [bootstrap.bootstrap_stats(counts, alive_prob, years, replicates=50, processes=processes)
+                     for processes in (1, 3)]
+        finally:
+            bootstrap.BLOCK_ROWS = block_rows
+
+        for stat in bootstrap.STATS:
+            for band in (0, 1):
+                np.testing.assert_array_equal(bands[0][stat][band], bands[1][stat][band])
+        np.testing.assert_array_equal(bands[0]["pass_rate"], bands[1]["pass_rate"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+#Statistics of an age distribution given as (year, weight) pairs
+#get_stats() and analysis() used to expand number_alive vs. years into a
+#list with one entry per person before calling numpy and scipy.
+#For a popular name that is millions of entries, so here the same
+#statistics are calculated directly from the weights:
+#  mean, median, std. dev. (np.std), skewness (st.skew) and kurtosis (st.kurtosis)
+#and, for "born between ... and ..." answers, any quantiles and the highest density
+#interval (the shortest range of years holding e.g. 90% of the people).
+#Fractional weights (number_alive is a float) are kept as they are.
+
+import numpy as np
+
+
+def weighted_median(years, weights):
+    """Given years and weights (same length, years in increasing order),
+    returns the median of the distribution.
+    For integer weights this is exactly np.median of the expanded histogram:
+    if the cumulative weight hits one half of the total exactly at a year,
+    the median is halfway between that year and the next year with people in it.
+    """
+    years = np.asarray(years, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    cumulative = np.cumsum(weights)
+    half = cumulative[-1] / 2.0
+
+    index = np.searchsorted(cumulative, half)  #first year with cumulative >= half
+    if cumulative[index] == half:
+        later = np.nonzero(weights[index + 1:] > 0)[0]
+        if len(later) > 0:
+            return (years[index] + years[index + 1 + later[0]]) / 2.0
+
+    return years[index]
+
+
+def weighted_stats(weights, years):
+    """Given the number of people (weights) for each year in years,
+    returns a tuple (mean, median, stddev, skewness, kurtosis) of the birth years.
+    Matches np.mean, np.median, np.std, st.skew and st.kurtosis (excess kurtosis)
+    of the expanded histogram. Returns nan for everything if nobody is left.
+    """
+    years = np.asarray(years, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    total = weights.sum()
+    if total <= 0:
+        return (np.nan, np.nan, np.nan, np.nan, np.nan)
+
+    mean = np.dot(weights, years) / total
+
+    #central moments
+    dev = years - mean
+    m2 = np.dot(weights, dev**2) / total
+    m3 = np.dot(weights, dev**3) / total
+    m4 = np.dot(weights, dev**4) / total
+
+    median = weighted_median(years, weights)
+    stddev = np.sqrt(m2)
+    if m2 > 0:
+        sk = m3 / m2**1.5
+        kurt = m4 / m2**2 - 3.0
+    else:
+        #everyone born in the same year, same as scipy
+        sk = 0.0
+        kurt = -3.0
+
+    return (mean, median, stddev, sk, kurt) #a tuple
+
+
+def weighted_median_matrix(years, weights):
+    """Same as weighted_median() for every row of a (names x years) weights matrix.
+    Returns an array with one median per row (nan for rows without weight).
+    """
+    return weighted_quantiles(weights, years, 0.5)
+
+
+def next_occupied(weights):
+    """For every column of a (rows x years) weights matrix, the next column
+    (after it) with weight in it, or the number of columns if there is none
+    """
+    n_rows, n_years = weights.shape
+    occupied = np.where(weights > 0, np.arange(n_years), n_years)
+    after = np.minimum.accumulate(occupied[:, ::-1], axis=1)[:, ::-1]
+
+    return np.hstack((after[:, 1:], np.full((n_rows, 1), n_years, dtype=after.dtype)))
+
+
+def weighted_quantiles(weights, years, q):
+    """Quantiles q (a fraction or a list of fractions between 0 and 1) of the birth years,
+    for one weights vector or every row of a (names x years) weights matrix at once.
+    The q quantile is the first year where the cumulative weight reaches q of the total,
+    or halfway to the next year with people in it if it hits q exactly there
+    (the same rule as weighted_median, i.e. the "averaged inverted CDF" of the expanded
+    histogram); q = 0 and q = 1 are the first and the last year with people in it.
+    Returns an array shaped like q for a vector, with one more (first) axis for the rows
+    of a matrix; nan for rows without weight.
+    """
+    years = np.asarray(years, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    q = np.asarray(q, dtype=float)
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError("quantiles must be between 0 and 1")
+    matrix = np.atleast_2d(weights)
+    n_rows, n_years = matrix.shape
+    rows = np.arange(n_rows)
+
+    cumulative = np.cumsum(matrix, axis=1)
+    total = cumulative[:, -1]
+    after = next_occupied(matrix)
+
+    quantiles = np.empty((n_rows, q.size))
+    for column, fraction in enumerate(q.ravel()):
+        target = fraction * total
+        #first year with people in it where the cumulative weight reaches the target
+        index = np.argmax((cumulative >= target[:, np.newaxis]) & (matrix > 0), axis=1)
+        quantiles[:, column] = years[index]
+
+        tie = (cumulative[rows, index] == target) & (after[rows, index] < n_years) & (target > 0)
+        quantiles[tie, column] = (years[index[tie]] + years[after[rows, index][tie]]) / 2.0
+
+    quantiles[~(total > 0)] = np.nan
+    if weights.ndim == 1:
+        return quantiles[0].reshape(q.shape)
+
+    return quantiles.reshape((n_rows,) + q.shape)
+
+
+def highest_density_interval(weights, years, mass=0.9):
+    """Shortest range of birth years (first year, last year) holding at least mass
+    (e.g. 0.5 or 0.9) of the weight: the most likely years of birth, which need not be
+    centered on the median for a skewed distribution. Among equally short ranges the
+    one holding the most weight (then the earliest) wins. Works on one weights vector, returning a tuple,
+    or on every row of a (names x years) matrix, returning a tuple of two arrays.
+    Rows without weight give nan.
+    """
+    years = np.asarray(years, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if not 0 < mass <= 1:
+        raise ValueError("mass must be above 0 and at most 1")
+    matrix = np.atleast_2d(weights)
+    n_rows, n_years = matrix.shape
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.nan_to_num(np.cumsum(matrix, axis=1) / matrix.sum(axis=1)[:, np.newaxis])
+    before = np.hstack((np.zeros((n_rows, 1)), fraction[:, :-1]))  #fraction before each year
+
+    #for a range starting at each year, the year where it first holds mass:
+    #one search over all the rows, each row shifted up by 2 to keep the rows apart
+    offset = 2.0 * np.arange(n_rows)[:, np.newaxis]
+    flat = (fraction + offset).ravel()
+    target = (before + mass - 1e-9 + offset).ravel()  #1e-9: rounding of the offsets
+    end = np.searchsorted(flat, target).reshape(n_rows, n_years) - n_years * np.arange(n_rows)[:, np.newaxis]
+
+    start = np.tile(np.arange(n_years), (n_rows, 1))
+    valid = end < n_years  #there is enough weight after the start
+    end = np.minimum(end, n_years - 1)
+    width = np.where(valid, years[end] - years[start], np.inf)
+    cumulative = np.cumsum(matrix, axis=1)
+    held = np.where(valid, cumulative[np.arange(n_rows)[:, np.newaxis], end] - cumulative + matrix, -np.inf)
+
+    best = np.lexsort((-held, width), axis=1)[:, 0]
+    low = years[best]
+    high = years[end[np.arange(n_rows), best]]
+    empty = ~(matrix.sum(axis=1) > 0)
+    low[empty] = np.nan
+    high[empty] = np.nan
+
+    if weights.ndim == 1:
+        return (low[0], high[0])
+
+    return (low, high)
+
+
+def weighted_stats_matrix(weights, years):
+    """Same as weighted_stats() for every row of a (names x years) weights matrix.
+    Returns a tuple of arrays (mean, median, stddev, skewness, kurtosis),
+    each with one value per row.
+    """
+    years = np.asarray(years, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = weights.sum(axis=1)
+        mean = weights.dot(years) / total
+
+        #central moments
+        dev = years[np.newaxis, :] - mean[:, np.newaxis]
+        dev2 = dev * dev
+        m2 = (weights * dev2).sum(axis=1) / total
+        m3 = (weights * dev2 * dev).sum(axis=1) / total
+        m4 = (weights * dev2 * dev2).sum(axis=1) / total
+
+        stddev = np.sqrt(m2)
+        sk = np.where(m2 > 0, m3 / m2**1.5, 0.0)
+        kurt = np.where(m2 > 0, m4 / m2**2 - 3.0, -3.0)
+
+    median = weighted_median_matrix(years, weights)
+
+    #nobody left
+    empty = ~(total > 0)
+    sk[empty] = np.nan
+    kurt[empty] = np.nan
+
+    return (mean, median, stddev, sk, kurt)